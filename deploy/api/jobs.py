@@ -0,0 +1,129 @@
+# jobs.py
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+JOBS_PER_HOST = int(os.getenv("JOBS_PER_HOST", "2"))          # provisionados simultáneos por servidor destino
+JOBS_MAX_RUNNING = int(os.getenv("JOBS_MAX_RUNNING", "16"))   # tope global (hilos ocupados)
+JOBS_TTL = int(os.getenv("JOBS_TTL_SECONDS", "3600"))         # cuánto se guardan los terminados
+
+ACTIVE = ("queued", "running")
+
+
+class Job:
+    def __init__(self, key: tuple, host: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.host = host
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events: list[dict] = []
+        self._subs: list[asyncio.Queue] = []
+
+    def emit(self, stage: str, **data):
+        ev = {"stage": stage, "ts": time.time(), **data}
+        self.events.append(ev)
+        self.updated_at = ev["ts"]
+        for q in self._subs:
+            q.put_nowait(ev)
+
+    def view(self) -> dict:
+        return {"id": self.id, "status": self.status, "host": self.host, "result": self.result,
+                "error": self.error, "created_at": self.created_at, "updated_at": self.updated_at,
+                "stage": self.events[-1]["stage"] if self.events else None}
+
+
+class JobQueue:
+    """
+    Cola asyncio para trabajo bloqueante contra servidores remotos (SSH/Ansible).
+    - el endpoint devuelve el id al instante; el trabajo corre en un hilo (to_thread)
+    - como mucho JOBS_PER_HOST trabajos a la vez por host y JOBS_MAX_RUNNING en total
+    - dos peticiones con la misma clave mientras la primera sigue activa comparten job
+    """
+
+    def __init__(self, per_host: int = JOBS_PER_HOST, max_running: int = JOBS_MAX_RUNNING):
+        self.per_host = per_host
+        self._global = asyncio.Semaphore(max_running)
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._jobs: dict[str, Job] = {}
+        self._active: dict[tuple, str] = {}   # key -> job id
+        self.coalesced = 0
+
+    def submit(self, key: tuple, host: str, fn: Callable[[Callable], Any]) -> tuple[Job, bool]:
+        """
+        Encola fn(progress) y devuelve (job, nuevo). `progress(stage, **data)` se
+        puede llamar desde el hilo del trabajo. Si ya hay un job activo con esa
+        clave, se devuelve ese (nuevo=False).
+        """
+        self._purge()
+        jid = self._active.get(key)
+        if jid and self._jobs[jid].status in ACTIVE:
+            self.coalesced += 1
+            return self._jobs[jid], False
+        job = Job(key, host)
+        self._jobs[job.id] = job
+        self._active[key] = job.id
+        job.emit("queued")
+        asyncio.get_running_loop().create_task(self._run(job, fn))
+        return job, True
+
+    async def _run(self, job: Job, fn):
+        loop = asyncio.get_running_loop()
+        host_sem = self._hosts.setdefault(job.host, asyncio.Semaphore(self.per_host))
+        progress = lambda stage, **data: loop.call_soon_threadsafe(lambda: job.emit(stage, **data))
+        async with host_sem, self._global:
+            job.status = "running"
+            job.emit("running")
+            status, result, error = "done", None, None
+            try:
+                result = await asyncio.to_thread(fn, progress)
+            except Exception as e:
+                status, error = "failed", str(e)
+        # deja que se entreguen los progress pendientes; estado y evento final van juntos
+        await asyncio.sleep(0)
+        job.status, job.result, job.error = status, result, error
+        job.emit(status, **({"error": error} if error else {}))
+        if self._active.get(job.key) == job.id:
+            del self._active[job.key]
+        for q in job._subs:
+            q.put_nowait(None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def stream(self, job: Job):
+        """ Eventos SSE: histórico + nuevos hasta que el job termina. """
+        q: asyncio.Queue = asyncio.Queue()
+        job._subs.append(q)
+        try:
+            for ev in list(job.events):
+                yield f"event: {ev['stage']}\ndata: {json.dumps(ev)}\n\n"
+            while job.status in ACTIVE or not q.empty():
+                try:
+                    ev = await asyncio.wait_for(q.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if ev is None:
+                    break
+                yield f"event: {ev['stage']}\ndata: {json.dumps(ev)}\n\n"
+            yield f"event: result\ndata: {json.dumps(job.view())}\n\n"
+        finally:
+            job._subs.remove(q)
+
+    def _purge(self):
+        now = time.time()
+        for jid in [j.id for j in self._jobs.values() if j.status not in ACTIVE and now - j.updated_at > JOBS_TTL]:
+            del self._jobs[jid]
+
+    def stats(self) -> dict:
+        by_status: dict[str, int] = {}
+        for j in self._jobs.values():
+            by_status[j.status] = by_status.get(j.status, 0) + 1
+        return {"jobs": by_status, "coalesced": self.coalesced, "per_host": self.per_host}
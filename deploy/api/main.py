@@ -2,6 +2,7 @@
 import os
 from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+import metrics
 
 # ====== MODO de ejecución ======
 APP_MODE = os.getenv("APP_MODE", "server").lower()  # "installer" | "server"
@@ -28,11 +29,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.HttpMetrics)
+
 # ====== Salud ======
 @app.get("/health")
 def health():
     return {"status": "ok", "mode": APP_MODE}
 
+# ====== Métricas (Prometheus) ======
+@app.get("/metrics")
+def prometheus_metrics():
+    body, ctype = metrics.render()
+    return Response(content=body, media_type=ctype)
+
 # ====== Rutas según MODO ======
 if APP_MODE == "installer":
     # --- Backend LOCAL para instalación asistida (FASE 1) ---
@@ -55,9 +64,11 @@ else:
     # Mantiene tus módulos existentes: peers/status/bootstrap/orchestrator/ssh_keys
     import io, qrcode
     from pydantic import BaseModel
-    from schemas import WGParamsReq, WGParamsResp
-    from pool import get_client_ip
-    from orchestrator import add_wg_peer
+    from fastapi.responses import StreamingResponse
+    from schemas import WGParamsReq, WGParamsResp, WGBatchReq, WGBatchResp, WGBatchClient, JobAccepted
+    from jobs import JobQueue
+    from pool import get_client_ip, alloc_client_ips
+    from orchestrator import add_wg_peer, add_wg_peers, host_facts, valid_wg_key
     from ssh_keys import ensure_ssh_key
     from bootstrap import router as bootstrap_router
 
@@ -68,23 +79,24 @@ else:
     app.include_router(bootstrap_router, prefix="/bootstrap", tags=["Bootstrap"])
 
     WG_PORT = int(os.getenv("WG_PORT", "51820"))
+    WG_BATCH_MAX = int(os.getenv("WG_BATCH_MAX", "1000"))
 
     class WGRequest(BaseModel):
         server_ip: str
         ssh_user: str
         client_name: str = "mi-dispositivo"
 
-    @app.post("/wg/server_params", response_model=WGParamsResp, tags=["WireGuard"])
-    def wg_server_params(req: WGParamsReq):
-        """
-        Devuelve parámetros del servidor WG + da de alta el peer (vía orchestrator).
-        Este endpoint está pensado para usarse desde el frontend del SERVIDOR (FASE 2).
-        """
+    # Provisionado en segundo plano: como mucho JOBS_PER_HOST a la vez por servidor
+    jobs = JobQueue()
+
+    def _provision(req: WGParamsReq, progress) -> dict:
         try:
+            progress("allocating")
             client_address = get_client_ip(req.peer_name)
             ssh_user = req.ssh_user or "ubuntu"
 
             # Alta real del peer en el servidor destino (puede usar Ansible/script)
+            progress("provisioning", client_address=client_address)
             server_public_key = add_wg_peer(
                 server_ip=req.server_hint,
                 ssh_user=ssh_user,
@@ -96,7 +108,7 @@ else:
         except Exception as e:
             import traceback
             traceback.print_exc()
-            raise HTTPException(status_code=500, detail=f"Provisioning error: {str(e)}")
+            raise RuntimeError(f"Provisioning error: {str(e)}")
 
         endpoint = f"{req.server_hint}:{WG_PORT}"
         return WGParamsResp(
@@ -105,7 +117,106 @@ else:
             dns="10.13.13.1",
             allowed_ips="0.0.0.0/0, ::/0",
             client_address=client_address,
-        )
+        ).model_dump()
+
+    @app.post("/wg/server_params", status_code=202, response_model=JobAccepted, tags=["WireGuard"])
+    async def wg_server_params(req: WGParamsReq):
+        """
+        Encola el alta del peer (vía orchestrator) y responde 202 con el id del job.
+        El resultado (WGParamsResp) se consulta en /wg/jobs/{id} o por SSE en
+        /wg/jobs/{id}/events. Una petición repetida para el mismo peer mientras la
+        primera sigue en curso devuelve el mismo job.
+        Este endpoint está pensado para usarse desde el frontend del SERVIDOR (FASE 2).
+        """
+        if not valid_wg_key(req.peer_public_key):
+            raise HTTPException(status_code=400, detail="peer_public_key no válida")
+        key = (req.server_hint, req.peer_name, req.peer_public_key)
+        job, new = jobs.submit(key, req.server_hint, lambda progress: _provision(req, progress))
+        return JobAccepted(job_id=job.id, status=job.status, coalesced=not new,
+                           status_url=f"/wg/jobs/{job.id}", events_url=f"/wg/jobs/{job.id}/events")
+
+    def _provision_batch(req: WGBatchReq, progress) -> dict:
+        try:
+            # todas las direcciones en una transacción del pool
+            progress("allocating", peers=len(req.peers))
+            addresses = alloc_client_ips([p.peer_name for p in req.peers])
+
+            # un único `wg set` con todo el lote en una sesión SSH
+            progress("provisioning", peers=len(req.peers))
+            server_public_key = add_wg_peers(
+                server_ip=req.server_hint,
+                ssh_user=req.ssh_user or "ubuntu",
+                peers=[(p.peer_public_key, addresses[p.peer_name]) for p in req.peers],
+                ssh_password=req.ssh_password,
+            )
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise RuntimeError(f"Provisioning error: {str(e)}")
+
+        endpoint = f"{req.server_hint}:{WG_PORT}"
+        return WGBatchResp(clients=[
+            WGBatchClient(
+                peer_name=p.peer_name,
+                endpoint=endpoint,
+                server_public_key=server_public_key,
+                dns="10.13.13.1",
+                allowed_ips="0.0.0.0/0, ::/0",
+                client_address=addresses[p.peer_name],
+            ) for p in req.peers
+        ]).model_dump()
+
+    @app.post("/wg/server_params/batch", status_code=202, response_model=JobAccepted, tags=["WireGuard"])
+    async def wg_server_params_batch(req: WGBatchReq):
+        """
+        Alta de un lote de peers contra un mismo servidor: un job, una transacción
+        del pool y un solo `wg set` remoto. El resultado del job es WGBatchResp.
+        """
+        if len(req.peers) > WG_BATCH_MAX:
+            raise HTTPException(status_code=413, detail=f"máximo {WG_BATCH_MAX} peers por lote")
+        names = [p.peer_name for p in req.peers]
+        if len(set(names)) != len(names):
+            raise HTTPException(status_code=400, detail="peer_name repetido en el lote")
+        keys = [p.peer_public_key for p in req.peers]
+        if len(set(keys)) != len(keys):
+            raise HTTPException(status_code=400, detail="peer_public_key repetida en el lote")
+        bad = [p.peer_name for p in req.peers if not valid_wg_key(p.peer_public_key)]
+        if bad:
+            # antes de reservar direcciones en el pool
+            raise HTTPException(status_code=400, detail=f"peer_public_key no válida: {', '.join(bad[:10])}")
+        key = (req.server_hint, "batch", tuple(sorted((p.peer_name, p.peer_public_key) for p in req.peers)))
+        job, new = jobs.submit(key, req.server_hint, lambda progress: _provision_batch(req, progress))
+        return JobAccepted(job_id=job.id, status=job.status, coalesced=not new,
+                           status_url=f"/wg/jobs/{job.id}", events_url=f"/wg/jobs/{job.id}/events")
+
+    @app.get("/wg/hosts", tags=["WireGuard"])
+    def wg_hosts():
+        # datos cacheados por servidor destino (clave wg0, modo, auth, bootstrap)
+        return host_facts.snapshot()
+
+    @app.delete("/wg/hosts/{server_ip}", tags=["WireGuard"])
+    def wg_host_invalidate(server_ip: str, ssh_user: str | None = None):
+        # tras rotar la clave de wg0 o reinstalar el servidor
+        return {"invalidated": host_facts.invalidate(server_ip, ssh_user)}
+
+    @app.get("/wg/jobs", tags=["WireGuard"])
+    def wg_jobs_stats():
+        return jobs.stats()
+
+    @app.get("/wg/jobs/{job_id}", tags=["WireGuard"])
+    def wg_job(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job no encontrado")
+        return job.view()
+
+    @app.get("/wg/jobs/{job_id}/events", tags=["WireGuard"])
+    async def wg_job_events(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job no encontrado")
+        return StreamingResponse(jobs.stream(job), media_type="text/event-stream")
 
     @app.post("/wg/qrcode", tags=["WireGuard"])
     def wg_qrcode(req: WGRequest):
@@ -0,0 +1,48 @@
+# metrics.py
+import time
+from prometheus_client import Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Métricas Prometheus del installer / API de despliegue (GET /metrics)
+REQUEST_SECONDS = Histogram("autovpn_deploy_http_request_duration_seconds", "Latencia por ruta",
+                            ["method", "route", "status"])
+ANSIBLE_SECONDS = Histogram("autovpn_ansible_subprocess_seconds", "Duración de los procesos ansible/ansible-playbook",
+                            ["kind", "ok"], buckets=(.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800))
+SSH_SECONDS = Histogram("autovpn_ssh_seconds", "Conexiones y comandos del pool SSH (orchestrator)",
+                        ["op", "ok"], buckets=(.01, .025, .05, .1, .25, .5, 1, 2, 5, 10, 30, 60))
+
+class HttpMetrics:
+    """ Middleware ASGI puro: la latencia llega hasta http.response.start (los SSE no la inflan). """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        done = False
+
+        def observe(status: int):
+            nonlocal done
+            done = True
+            path = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - t0)
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and not done:
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            if not done:
+                observe(500)
+
+def observe_ansible(kind: str, seconds: float, ok: bool):
+    ANSIBLE_SECONDS.labels(kind, "1" if ok else "0").observe(seconds)
+
+def observe_ssh(op: str, seconds: float, ok: bool):
+    SSH_SECONDS.labels(op, "1" if ok else "0").observe(seconds)
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
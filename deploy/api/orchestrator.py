@@ -1,16 +1,81 @@
 # orchestrator.py
 import os
+import re
 import subprocess
 import tempfile
+import threading
+import time
 from pathlib import Path
 from typing import Optional
 
 from ssh_keys import ensure_ssh_key  # garantiza la clave del controlador
+from metrics import observe_ansible
+from sshpool import SSHPool
 
 SSH_KEY_PATH = ensure_ssh_key()
 WG_PORT = int(os.getenv("WG_PORT", "51820"))
-WG_MODE = os.getenv("WG_MODE", "container").lower()  # "container" | "host"
+WG_MODE = os.getenv("WG_MODE", "container").lower()  # "container" | "host" | "auto" (detecta por host)
 WG_CONTAINER = os.getenv("WG_CONTAINER_NAME", "wireguard")
+# Comandos sueltos (alta de peer, clave pública, bootstrap):
+#   "pool"    -> conexión SSH persistente por host (paramiko), un round-trip por comando
+#   "ansible" -> ansible ad-hoc con inventario temporal (comportamiento anterior)
+# Los playbooks completos siguen yendo por ansible-playbook (routers/install.py).
+SSH_TRANSPORT = os.getenv("SSH_TRANSPORT", "pool").lower()
+
+ssh_pool = SSHPool(SSH_KEY_PATH)
+# Cuánto se confía en lo descubierto de cada host (clave de wg0, modo, auth)
+HOST_FACTS_TTL = int(os.getenv("HOST_FACTS_TTL", "3600"))
+
+
+class HostFacts:
+    """
+    Caché por (host, usuario) de lo que add_wg_peer descubría en cada llamada:
+    clave pública de wg0, modo WG (host|container), método de auth que funciona
+    y si ya se hizo bootstrap. Con la caché caliente un alta es solo `wg set`.
+    Se invalida al caducar (HOST_FACTS_TTL), a mano (invalidate) o cuando un
+    comando falla con los datos cacheados.
+    """
+
+    def __init__(self, ttl: int = HOST_FACTS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._facts: dict[tuple, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, server_ip: str, ssh_user: str) -> dict:
+        with self._lock:
+            f = self._facts.get((server_ip, ssh_user))
+            if f is not None and time.time() - f["ts"] > self.ttl:
+                del self._facts[(server_ip, ssh_user)]
+                f = None
+            if f is None:
+                self.misses += 1
+                return {}
+            self.hits += 1
+            return dict(f)
+
+    def update(self, server_ip: str, ssh_user: str, **facts):
+        with self._lock:
+            f = self._facts.setdefault((server_ip, ssh_user), {"ts": time.time()})
+            f.update(facts)
+
+    def invalidate(self, server_ip: str, ssh_user: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [k for k in self._facts if k[0] == server_ip and (ssh_user is None or k[1] == ssh_user)]
+            for k in keys:
+                del self._facts[k]
+        ssh_pool.invalidate(server_ip, ssh_user)
+        return len(keys)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "ttl": self.ttl,
+                    "hosts": [{"host": h, "user": u, **{k: v for k, v in f.items()}}
+                              for (h, u), f in self._facts.items()]}
+
+
+host_facts = HostFacts()
 
 
 # ---------------------------
@@ -51,14 +116,39 @@ def _ansible_shell(inv_path: str, cmdline: str, become: bool = True) -> subproce
     ]
     if become:
         cmd.insert(3, "-b")
-    return subprocess.run(cmd, check=True, text=True, capture_output=True)
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        res = subprocess.run(cmd, check=True, text=True, capture_output=True)
+        ok = True
+        return res
+    finally:
+        observe_ansible("adhoc", time.perf_counter() - t0, ok)
+
+
+def _last_line(out: str) -> str:
+    lines = [l.strip() for l in (out or "").splitlines() if l.strip()]
+    return lines[-1] if lines else ""
 
 
 def _ansible_stdout(inv_path: str, cmdline: str, become: bool = True) -> str:
     res = _ansible_shell(inv_path, cmdline, become=become)
     # Filtra la salida de Ansible y devuelve la última línea no vacía
-    lines = [l.strip() for l in (res.stdout or "").splitlines() if l.strip()]
-    return lines[-1] if lines else ""
+    return _last_line(res.stdout)
+
+
+def _remote(server_ip: str, ssh_user: str, cmdline: str, become: bool = True) -> str:
+    """
+    Ejecuta un comando corto en el host por clave y devuelve la última línea de
+    stdout. Errores como subprocess.CalledProcessError en ambos transportes.
+    """
+    if SSH_TRANSPORT == "ansible":
+        inv = _write_temp_inventory_ini(server_ip, ssh_user)
+        try:
+            return _ansible_stdout(inv, cmdline, become=become)
+        finally:
+            Path(inv).unlink(missing_ok=True)
+    return _last_line(ssh_pool.run(server_ip, ssh_user, cmdline, become=become))
 
 
 # ---------------------------
@@ -70,25 +160,31 @@ def _bootstrap_install_key_with_password(server_ip: str, ssh_user: str, ssh_pass
     Conexión por password (paramiko) para instalar la clave pública del controlador
     en authorized_keys del usuario remoto. Requiere que el host permita password temporalmente.
     """
-    extra = {
-        "ansible_connection": "paramiko",
-        "ansible_password": ssh_password,
-    }
-    inv = _write_temp_inventory_ini(server_ip, ssh_user, extra=extra)
     pub_path = f"{SSH_KEY_PATH}.pub"
     if not Path(pub_path).exists():
         raise RuntimeError("Clave pública no encontrada para bootstrap (expected <key>.pub)")
+    pub = Path(pub_path).read_text(encoding="utf-8").strip()
 
     # Crea .ssh si no existe y añade la pubkey si no está presente
+    # (la clave va en el propio script: el .pub vive en el controlador, no en el host)
     script = rf"""
 set -e
 mkdir -p ~/.ssh
 chmod 700 ~/.ssh
-grep -q -F "$(cat {pub_path})" ~/.ssh/authorized_keys 2>/dev/null || \
-  (echo "$(cat {pub_path})" >> ~/.ssh/authorized_keys && chmod 600 ~/.ssh/authorized_keys)
+grep -q -F '{pub}' ~/.ssh/authorized_keys 2>/dev/null || \
+  (echo '{pub}' >> ~/.ssh/authorized_keys && chmod 600 ~/.ssh/authorized_keys)
 echo BOOTSTRAP_OK
 """
-    out = _ansible_stdout(inv, script, become=False)  # authorized_keys pertenece al usuario, no usar become
+    # authorized_keys pertenece al usuario, no usar become
+    if SSH_TRANSPORT == "ansible":
+        extra = {
+            "ansible_connection": "paramiko",
+            "ansible_password": ssh_password,
+        }
+        inv = _write_temp_inventory_ini(server_ip, ssh_user, extra=extra)
+        out = _ansible_stdout(inv, script, become=False)
+    else:
+        out = ssh_pool.run(server_ip, ssh_user, script, become=False, password=ssh_password)
     if "BOOTSTRAP_OK" not in out:
         raise RuntimeError("No se pudo instalar la clave pública en authorized_keys")
 
@@ -97,35 +193,60 @@ echo BOOTSTRAP_OK
 # Alta de peer en WG (host o contenedor)
 # ---------------------------
 
-def _cmd_wg_add_peer(peer_pubkey: str, client_address: str) -> str:
+def _cmd_wg_mode_detect() -> str:
     """
-    Devuelve el comando shell para añadir un peer según WG_MODE.
-    - host:       wg set wg0 peer <pub> allowed-ips <addr>/32
-    - container:  docker exec <name> wg set wg0 peer <pub> allowed-ips <addr>/32
+    Para WG_MODE=auto: "container" si existe el contenedor WG, si no "host".
     """
-    base = f"wg set wg0 peer {peer_pubkey} allowed-ips {client_address}"
-    if WG_MODE == "host":
+    return (f"if docker inspect {WG_CONTAINER} >/dev/null 2>&1; then echo container; "
+            f"else echo host; fi")
+
+
+def _cmd_wg_add_peers(peers: list[tuple[str, str]], mode: str = WG_MODE) -> str:
+    """
+    Devuelve un único comando shell que añade todos los peers [(pubkey, address), ...].
+    - host:       wg set wg0 peer <pub1> allowed-ips <addr1> peer <pub2> allowed-ips <addr2> ...
+    - container:  docker exec <name> wg set wg0 peer <pub1> allowed-ips <addr1> ...
+    """
+    base = "wg set wg0 " + " ".join(f"peer {pub} allowed-ips {addr}" for pub, addr in peers)
+    if mode == "host":
         return base
     # por defecto contenedor
     return f"docker exec {WG_CONTAINER} {base}"
 
 
-def _cmd_wg_pubkey() -> str:
+# las claves y direcciones acaban en una línea de shell remota: solo formatos válidos
+_WG_KEY_RE = re.compile(r"^[A-Za-z0-9+/]{42}[AEIMQUYcgkosw048]=$")
+_ADDR_RE = re.compile(r"^[0-9a-fA-F:.]+/\d{1,3}$")
+
+
+def valid_wg_key(pub: str) -> bool:
+    return bool(_WG_KEY_RE.match(pub))
+
+
+def _check_peers(peers: list[tuple[str, str]]):
+    for pub, addr in peers:
+        if not valid_wg_key(pub):
+            raise ValueError(f"Clave pública WireGuard no válida: {pub!r}")
+        if not _ADDR_RE.match(addr):
+            raise ValueError(f"Dirección no válida: {addr!r}")
+
+
+def _cmd_wg_pubkey(mode: str = WG_MODE) -> str:
     """
     Devuelve el comando para obtener la public key del servidor wg0.
     """
     base = "wg show wg0 public-key"
-    if WG_MODE == "host":
+    if mode == "host":
         return base
     return f"docker exec {WG_CONTAINER} {base}"
 
 
-def _cmd_wg_pubkey_fallback() -> str:
+def _cmd_wg_pubkey_fallback(mode: str = WG_MODE) -> str:
     """
     Fallback para obtener la clave pública desde fichero, si la mantienes en host.
     Ajusta la ruta si tu rol las guarda en otro sitio (contenedor/volumen).
     """
-    if WG_MODE == "host":
+    if mode == "host":
         # ejemplo típico si guardas server.key y server.pub en /etc/wireguard
         return "cat /etc/wireguard/server.pub || (wg pubkey < /etc/wireguard/server.key)"
     # En contenedor: intenta leer desde volumen montado (ajusta si usas otra ruta/imagen)
@@ -138,50 +259,70 @@ def _cmd_wg_pubkey_fallback() -> str:
 
 def add_wg_peer(server_ip: str, ssh_user: str, peer_pubkey: str, client_address: str,
                 ssh_password: Optional[str] = None) -> str:
+    return add_wg_peers(server_ip, ssh_user, [(peer_pubkey, client_address)], ssh_password)
+
+
+def add_wg_peers(server_ip: str, ssh_user: str, peers: list[tuple[str, str]],
+                 ssh_password: Optional[str] = None) -> str:
     """
-    Alta de peer WireGuard en el servidor destino:
-      1) Intenta por clave (inventario temporal con tu SSH_KEY_PATH).
+    Alta de uno o varios peers WireGuard [(pubkey, address), ...] en el servidor
+    destino con un único `wg set` (una sesión SSH para todo el lote):
+      1) Alta + clave pública de wg0 en un solo comando remoto, por clave
+         (conexión persistente del pool SSH, o Ansible si SSH_TRANSPORT=ansible).
       2) Si falla por permisos y se aporta ssh_password:
            - hace bootstrap (paramiko) para meter la clave pública
            - reintenta por clave
-      3) Devuelve server_public_key (wg0).
+      3) Devuelve server_public_key (wg0); si `wg show` no la da, usa el fallback.
+    Clave de wg0, modo WG y auth quedan en host_facts: con la caché caliente el
+    alta es un único `wg set` sin ningún descubrimiento.
 
     Requisitos en el servidor:
       - WG nativo (wg-quick@wg0) o contenedor accesible por 'docker exec <WG_CONTAINER>'.
       - Usuario con sudo (become) para ejecutar wg/iptables si es nativo.
     """
-    # Inventario por clave
-    inv_key = _write_temp_inventory_ini(
-        server_ip, ssh_user,
-        extra={
-            # nada extra; usamos private key y become
-        },
-    )
+    _check_peers(peers)
+    facts = host_facts.get(server_ip, ssh_user)
 
-    # 1) Alta del peer
-    try:
-        cmd_add = _cmd_wg_add_peer(peer_pubkey, client_address)
-        _ansible_shell(inv_key, cmd_add, become=True)
-    except subprocess.CalledProcessError as e:
-        err = (e.stderr or e.stdout or "").lower()
-        needs_bootstrap = ssh_password and ("permission denied" in err or "unreachable" in err)
-        if not needs_bootstrap:
-            raise
-
-        # 2) Bootstrap por password y reintento por clave
-        _bootstrap_install_key_with_password(server_ip, ssh_user, ssh_password)
-        _ansible_shell(inv_key, cmd_add, become=True)
-
-    # 3) Clave pública del servidor
-    try:
-        server_pub = _ansible_stdout(inv_key, _cmd_wg_pubkey(), become=True)
-        if not server_pub or server_pub.lower().startswith("wg:"):
-            raise RuntimeError("wg show fallback")
-    except Exception:
-        server_pub = _ansible_stdout(inv_key, _cmd_wg_pubkey_fallback(), become=True)
+    def run(cmdline: str) -> str:
+        try:
+            out = _remote(server_ip, ssh_user, cmdline, become=True)
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or e.stdout or "").lower()
+            needs_bootstrap = ssh_password and ("permission denied" in err or "unreachable" in err)
+            if not needs_bootstrap:
+                if facts:
+                    # quizá lo cacheado ya no vale (modo, contenedor recreado...): se redescubre la próxima vez
+                    host_facts.invalidate(server_ip, ssh_user)
+                raise
+
+            # 2) Bootstrap por password y reintento por clave
+            _bootstrap_install_key_with_password(server_ip, ssh_user, ssh_password)
+            host_facts.update(server_ip, ssh_user, bootstrapped=True, bootstrapped_at=time.time())
+            out = _remote(server_ip, ssh_user, cmdline, become=True)
+        host_facts.update(server_ip, ssh_user, auth="key")
+        return out
+
+    # Modo WG: fijo por entorno o detectado una vez por host
+    mode = facts.get("wg_mode") or WG_MODE
+    if mode == "auto":
+        mode = run(_cmd_wg_mode_detect()) or "container"
+        host_facts.update(server_ip, ssh_user, wg_mode=mode)
+
+    # 1) Alta del peer (con la clave de wg0 en el mismo round-trip si no está en caché)
+    server_pub = facts.get("server_pub")
+    cmd_add = _cmd_wg_add_peers(peers, mode)
+    if server_pub:
+        run(cmd_add)
+        return server_pub
+
+    server_pub = run(f"{cmd_add} && ({_cmd_wg_pubkey(mode)} || true)")
+
+    # 3) Clave pública del servidor (fallback desde fichero)
+    if not server_pub or server_pub.lower().startswith("wg:"):
+        server_pub = run(_cmd_wg_pubkey_fallback(mode))
 
     if not server_pub:
         raise RuntimeError("No se pudo obtener la clave pública de wg0")
 
+    host_facts.update(server_ip, ssh_user, server_pub=server_pub, wg_mode=mode)
     return server_pub
-
@@ -1,47 +1,154 @@
-import json, ipaddress
+import os, json, time, sqlite3, threading, ipaddress
 from pathlib import Path
 
-STATE_DIR = Path("/app/state")
-STATE_FILE = STATE_DIR / "peers.json"
-POOL_CIDR = ipaddress.ip_network("10.13.13.0/24")
-SERVER_IP = ipaddress.ip_address("10.13.13.1")  # wg0 del servidor
+# Pool de IPs de clientes en SQLite (stdlib): nombre de peer -> dirección /32.
+# - búsqueda por nombre con la PRIMARY KEY, sin releer ni parsear ficheros
+# - asignación atómica: BEGIN IMMEDIATE serializa escritores (hilos y procesos)
+# - marca de agua por CIDR + lista de huecos liberados: sin recorrer hosts()
+STATE_DIR = Path(os.getenv("STATE_DIR", "/app/state"))
+STATE_FILE = STATE_DIR / "peers.json"          # formato antiguo; se migra al arrancar
+POOL_DB = Path(os.getenv("POOL_DB", str(STATE_DIR / "pool.db")))
+# WG_POOL_CIDRS="10.13.13.0/24,10.13.14.0/24": se llenan en orden
+POOL_CIDRS = [ipaddress.ip_network(c.strip()) for c in os.getenv("WG_POOL_CIDRS", "10.13.13.0/24").split(",") if c.strip()]
+POOL_CIDR = POOL_CIDRS[0]
+SERVER_IP = ipaddress.ip_address(os.getenv("WG_SERVER_IP", str(POOL_CIDR.network_address + 1)))  # wg0 del servidor
 
-def _load_state():
-    STATE_DIR.mkdir(parents=True, exist_ok=True)
-    if STATE_FILE.exists():
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peers (name TEXT PRIMARY KEY, address TEXT NOT NULL UNIQUE, created_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS cursors (cidr TEXT PRIMARY KEY, next INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS free (address TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL);
+"""
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        POOL_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(POOL_DB, isolation_level=None, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _migrate_json(conn)
+        _conn = conn
+    return _conn
+
+class _tx:
+    """ BEGIN IMMEDIATE ... COMMIT/ROLLBACK bajo el lock del proceso. """
+    def __enter__(self):
+        _lock.acquire()
+        self.c = _db()
+        self.c.execute("BEGIN IMMEDIATE")
+        return self.c
+    def __exit__(self, exc_type, *_):
         try:
-            data = json.loads(STATE_FILE.read_text())
-            if "allocated" not in data:
-                data["allocated"] = {}
-            return data
-        except json.JSONDecodeError:
-            # Si el archivo está corrupto o vacío, reinicia
-            return {"allocated": {}}
-    return {"allocated": {}}
+            self.c.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            _lock.release()
 
+def _next_free(c: sqlite3.Connection) -> str:
+    while row := c.execute("SELECT address FROM free LIMIT 1").fetchone():
+        c.execute("DELETE FROM free WHERE address = ?", row)
+        # huecos de un CIDR que ya no está configurado se descartan
+        if any(ipaddress.ip_network(row[0]).network_address in net for net in POOL_CIDRS):
+            return row[0]
+    for net in POOL_CIDRS:
+        row = c.execute("SELECT next FROM cursors WHERE cidr = ?", (str(net),)).fetchone()
+        offset = row[0] if row else 1
+        # red y broadcast fuera; la IP del servidor se salta
+        while offset < net.num_addresses - 1 and net[offset] == SERVER_IP:
+            offset += 1
+        if offset < net.num_addresses - 1:
+            c.execute("INSERT INTO cursors (cidr, next) VALUES (?, ?) ON CONFLICT(cidr) DO UPDATE SET next = excluded.next",
+                      (str(net), offset + 1))
+            return f"{net[offset]}/32"
+    raise RuntimeError(f"No hay IPs libres en el pool {','.join(map(str, POOL_CIDRS))}")
+
+def _migrate_json(c: sqlite3.Connection):
+    # peers.json -> SQLite, una sola vez; el fichero se conserva renombrado.
+    # Todo bajo BEGIN IMMEDIATE y con marca en `meta`: si varios workers arrancan a la vez,
+    # el segundo ve la marca y no vuelve a aplicar un JSON viejo sobre asignaciones nuevas.
+    if not STATE_FILE.exists():
+        return
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        if c.execute("SELECT 1 FROM meta WHERE k = 'json_migrated'").fetchone():
+            c.execute("COMMIT")
+            _rename_json()
+            return
+        try:
+            allocated = json.loads(STATE_FILE.read_text()).get("allocated", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            allocated = {}
+        now = time.time()
+        for name, v in allocated.items():
+            c.execute("INSERT OR IGNORE INTO peers (name, address, created_at) VALUES (?, ?, ?)", (name, v["address"], now))
+        # marca de agua de cada CIDR tras la mayor dirección migrada (los huecos quedan libres)
+        for net in POOL_CIDRS:
+            offsets = sorted(int(ipaddress.ip_network(v["address"]).network_address) - int(net.network_address)
+                             for v in allocated.values()
+                             if ipaddress.ip_network(v["address"]).network_address in net)
+            if not offsets:
+                continue
+            used = set(offsets)
+            for off in range(1, offsets[-1]):
+                if off not in used and net[off] != SERVER_IP:
+                    c.execute("INSERT OR IGNORE INTO free (address) SELECT ? WHERE NOT EXISTS "
+                              "(SELECT 1 FROM peers WHERE address = ?)", (f"{net[off]}/32",) * 2)
+            # la marca de agua nunca retrocede
+            c.execute("INSERT INTO cursors (cidr, next) VALUES (?, ?) "
+                      "ON CONFLICT(cidr) DO UPDATE SET next = max(next, excluded.next)", (str(net), offsets[-1] + 1))
+        c.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('json_migrated', ?)", (str(now),))
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    _rename_json()
 
-def _save_state(state):
-    STATE_FILE.write_text(json.dumps(state, indent=2))
+def _rename_json():
+    try:
+        STATE_FILE.rename(STATE_FILE.with_suffix(".json.migrated"))
+    except FileNotFoundError:
+        pass  # otro worker ya lo renombró
+
+def lookup_client_ip(peer_name: str) -> str | None:
+    with _lock:
+        row = _db().execute("SELECT address FROM peers WHERE name = ?", (peer_name,)).fetchone()
+    return row[0] if row else None
 
 def alloc_client_ip(peer_name: str) -> str:
-    """ Devuelve 'x.x.x.x/32' sin colisión. """
-    state = _load_state()
-    used = {ipaddress.ip_network(v["address"]).network_address for v in state["allocated"].values()}
-    used.add(SERVER_IP)
-
-    for host in POOL_CIDR.hosts():
-        if host == SERVER_IP:
-            continue
-        if host not in used:
-            cidr = f"{host}/32"
-            state["allocated"][peer_name] = {"address": cidr}
-            _save_state(state)
-            return cidr
-    raise RuntimeError("No hay IPs libres en el pool 10.13.13.0/24")
+    """ Devuelve 'x.x.x.x/32' sin colisión (la existente si el peer ya tenía). """
+    with _tx() as c:
+        row = c.execute("SELECT address FROM peers WHERE name = ?", (peer_name,)).fetchone()
+        if row:
+            return row[0]
+        cidr = _next_free(c)
+        c.execute("INSERT INTO peers (name, address, created_at) VALUES (?, ?, ?)", (peer_name, cidr, time.time()))
+        return cidr
 
-def get_client_ip(peer_name: str) -> str:
-    state = _load_state()
-    if peer_name in state["allocated"]:
-        return state["allocated"][peer_name]["address"]
-    return alloc_client_ip(peer_name)
+def alloc_client_ips(peer_names: list[str]) -> dict[str, str]:
+    """ Igual que alloc_client_ip para un lote, en una sola transacción (todo o nada). """
+    out: dict[str, str] = {}
+    with _tx() as c:
+        for name in dict.fromkeys(peer_names):
+            row = c.execute("SELECT address FROM peers WHERE name = ?", (name,)).fetchone()
+            if row:
+                out[name] = row[0]
+                continue
+            out[name] = _next_free(c)
+            c.execute("INSERT INTO peers (name, address, created_at) VALUES (?, ?, ?)", (name, out[name], time.time()))
+    return out
 
+def release_client_ip(peer_name: str) -> str | None:
+    with _tx() as c:
+        row = c.execute("SELECT address FROM peers WHERE name = ?", (peer_name,)).fetchone()
+        if not row:
+            return None
+        c.execute("DELETE FROM peers WHERE name = ?", (peer_name,))
+        c.execute("INSERT OR IGNORE INTO free (address) VALUES (?)", row)
+        return row[0]
+
+def get_client_ip(peer_name: str) -> str:
+    return lookup_client_ip(peer_name) or alloc_client_ip(peer_name)
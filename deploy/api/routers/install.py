@@ -5,12 +5,14 @@ import os
 import shlex
 import stat
 import tempfile
+import time
 from pathlib import Path
 from typing import AsyncGenerator, Optional
 
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 
+from metrics import observe_ansible
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Body, BackgroundTasks
 from fastapi.responses import FileResponse
@@ -129,6 +131,7 @@ async def _run_stream(cmd: list[str]) -> AsyncGenerator[str, None]:
     """
     Ejecuta un comando y emite la salida línea a línea (merge stdout/stderr).
     """
+    t0 = time.perf_counter()
     proc = await asyncio.create_subprocess_exec(
         *cmd,
         cwd=str(ANSIBLE_DIR),
@@ -139,6 +142,7 @@ async def _run_stream(cmd: list[str]) -> AsyncGenerator[str, None]:
     async for raw in proc.stdout:
         yield raw.decode(errors="ignore").rstrip("\n")
     await proc.wait()
+    observe_ansible("playbook", time.perf_counter() - t0, proc.returncode == 0)
 
 
 def _require_yaml():
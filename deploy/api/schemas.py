@@ -16,6 +16,29 @@ class WGParamsResp(BaseModel):
     allowed_ips: str
     client_address: str
 
+class WGBatchPeer(BaseModel):
+    peer_name: str
+    peer_public_key: str
+
+class WGBatchReq(BaseModel):
+    server_hint: str
+    peers: list[WGBatchPeer] = Field(..., min_length=1)
+    ssh_user: str | None = None
+    ssh_password: str | None = None
+
+class WGBatchClient(WGParamsResp):
+    peer_name: str
+
+class WGBatchResp(BaseModel):
+    clients: list[WGBatchClient]
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+    coalesced: bool = False
+    status_url: str
+    events_url: str
+
 # --- nuevos para installer ---
 class SSHConfig(BaseModel):
     elastic_ip: str
@@ -0,0 +1,159 @@
+# sshpool.py
+import os
+import shlex
+import socket
+import subprocess
+import threading
+import time
+from typing import Optional
+
+import paramiko
+
+from metrics import observe_ssh
+
+SSH_PORT = int(os.getenv("SSH_PORT", "22"))
+SSH_CONNECT_TIMEOUT = int(os.getenv("SSH_CONNECT_TIMEOUT", "15"))
+SSH_COMMAND_TIMEOUT = int(os.getenv("SSH_COMMAND_TIMEOUT", "60"))
+SSH_IDLE_SECONDS = int(os.getenv("SSH_POOL_IDLE_SECONDS", "300"))   # cierra conexiones sin uso
+SSH_KEEPALIVE = int(os.getenv("SSH_KEEPALIVE", "30"))
+
+
+class RemoteCommandError(subprocess.CalledProcessError):
+    """
+    Mismo tipo que lanzaba subprocess.run(ansible..., check=True): quien ya
+    inspecciona e.stderr ("permission denied", "unreachable") sigue igual.
+    """
+
+
+class SSHPool:
+    """
+    Una conexión SSH (transport paramiko) persistente por (host, usuario, puerto).
+    Cada comando abre un canal sobre ella: sin handshake ni arranque de Ansible,
+    un comando remoto cuesta un round-trip. Las conexiones caídas se rehacen una
+    vez y las ociosas se cierran pasado SSH_POOL_IDLE_SECONDS.
+    """
+
+    def __init__(self, key_path: str):
+        self.key_path = key_path
+        self._lock = threading.Lock()
+        self._hosts: dict[tuple, dict] = {}   # key -> {"client", "lock", "used"}
+
+    def _entry(self, key: tuple) -> dict:
+        with self._lock:
+            self._evict_idle()
+            return self._hosts.setdefault(key, {"client": None, "lock": threading.Lock(), "used": time.monotonic()})
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key, e in list(self._hosts.items()):
+            if e["client"] is not None and now - e["used"] > SSH_IDLE_SECONDS:
+                self._close(e)
+                del self._hosts[key]
+
+    @staticmethod
+    def _close(e: dict):
+        try:
+            if e["client"] is not None:
+                e["client"].close()
+        except Exception:
+            pass
+        e["client"] = None
+
+    def _connect(self, host: str, user: str, port: int, password: Optional[str] = None) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        # equivalente a StrictHostKeyChecking=no del inventario de Ansible
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        kwargs = dict(hostname=host, username=user, port=port, allow_agent=False, look_for_keys=False,
+                      timeout=SSH_CONNECT_TIMEOUT, banner_timeout=SSH_CONNECT_TIMEOUT, auth_timeout=SSH_CONNECT_TIMEOUT)
+        if password:
+            kwargs["password"] = password
+        else:
+            kwargs["key_filename"] = self.key_path
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            client.connect(**kwargs)
+            ok = True
+        except paramiko.AuthenticationException as e:
+            raise RemoteCommandError(255, ["ssh", host], "", f"Permission denied: {e}")
+        except (paramiko.SSHException, socket.error) as e:
+            raise RemoteCommandError(255, ["ssh", host], "", f"UNREACHABLE: {e}")
+        finally:
+            observe_ssh("connect", time.perf_counter() - t0, ok)
+        client.get_transport().set_keepalive(SSH_KEEPALIVE)
+        return client
+
+    @staticmethod
+    def _exec(client: paramiko.SSHClient, cmdline: str, timeout: int) -> tuple[int, str, str]:
+        _stdin, stdout, stderr = client.exec_command(cmdline, timeout=timeout)
+        out = stdout.read().decode("utf-8", "ignore")
+        err = stderr.read().decode("utf-8", "ignore")
+        return stdout.channel.recv_exit_status(), out, err
+
+    def run(self, host: str, user: str, cmdline: str, become: bool = True, port: int = SSH_PORT,
+            password: Optional[str] = None, timeout: int = SSH_COMMAND_TIMEOUT) -> str:
+        """
+        Ejecuta cmdline en el host y devuelve stdout. Con become=True va por
+        `sudo -n` (como ansible -b). Con password la conexión es de un solo uso
+        (bootstrap) y no entra en el pool.
+        """
+        if become:
+            cmdline = f"sudo -n sh -c {shlex.quote(cmdline)}"
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            if password:
+                client = self._connect(host, user, port, password)
+                try:
+                    rc, out, err = self._exec(client, cmdline, timeout)
+                finally:
+                    client.close()
+            else:
+                rc, out, err = self._pooled(host, user, port, cmdline, timeout)
+            if rc != 0:
+                raise RemoteCommandError(rc, cmdline, out, err)
+            ok = True
+            return out
+        finally:
+            observe_ssh("exec", time.perf_counter() - t0, ok)
+
+    def _client(self, e: dict, host: str, user: str, port: int, stale=None) -> paramiko.SSHClient:
+        with e["lock"]:
+            if stale is not None and e["client"] is stale:
+                self._close(e)
+            client = e["client"]
+            transport = client.get_transport() if client is not None else None
+            if transport is None or not transport.is_active():
+                self._close(e)
+                e["client"] = client = self._connect(host, user, port)
+            return client
+
+    def _pooled(self, host: str, user: str, port: int, cmdline: str, timeout: int) -> tuple[int, str, str]:
+        # un canal por comando sobre el mismo transport: comandos concurrentes al mismo host no se esperan
+        e = self._entry((host, user, port))
+        e["used"] = time.monotonic()
+        client = self._client(e, host, user, port)
+        try:
+            res = self._exec(client, cmdline, timeout)
+        except (paramiko.SSHException, EOFError, socket.error):
+            # el servidor cerró la conexión reutilizada: se rehace una vez
+            client = self._client(e, host, user, port, stale=client)
+            res = self._exec(client, cmdline, timeout)
+        e["used"] = time.monotonic()
+        return res
+
+    def invalidate(self, host: str, user: Optional[str] = None):
+        with self._lock:
+            for key in [k for k in self._hosts if k[0] == host and (user is None or k[1] == user)]:
+                self._close(self._hosts.pop(key))
+
+    def close_all(self):
+        with self._lock:
+            for e in self._hosts.values():
+                self._close(e)
+            self._hosts.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"connections": sum(1 for e in self._hosts.values() if e["client"] is not None),
+                    "hosts": sorted({k[0] for k in self._hosts})}
@@ -0,0 +1,161 @@
+import os, io, hashlib, threading
+from collections import OrderedDict
+from pathlib import Path
+from app.wg import render_client_conf, WG_HOST, WG_PORT, WG_DNS
+
+ARTIFACT_CACHE_MB = int(os.getenv("ARTIFACT_CACHE_MB", "32"))
+# vacío = sin volcado a disco
+ARTIFACT_DISK_DIR = os.getenv("ARTIFACT_DISK_DIR", "")
+ARTIFACT_DISK_MB = int(os.getenv("ARTIFACT_DISK_MB", "256"))
+
+MEDIA = {"conf": "text/plain", "png": "image/png", "svg": "image/svg+xml"}
+
+class ArtifactCache:
+    """
+    Caché direccionada por contenido de .conf y QR: la clave es el hash de todo
+    lo que influye en el resultado (peer, clave del servidor, endpoint, DNS), así
+    que cualquier cambio produce otra clave y lo viejo sale por LRU.
+    La clave (con el id del peer delante) sirve además como ETag.
+    El volcado a disco también es LRU, acotado a ARTIFACT_DISK_MB; los ficheros
+    de un peer se borran al revocarlo (el .conf lleva su clave privada).
+    """
+    def __init__(self, max_bytes: int = ARTIFACT_CACHE_MB * 1024 * 1024, disk_dir: str = ARTIFACT_DISK_DIR,
+                 max_disk_bytes: int = ARTIFACT_DISK_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk = Path(disk_dir) if disk_dir else None
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._disk_lru: OrderedDict[str, int] = OrderedDict()   # key -> bytes en disco
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if self.disk:
+            self._scan_disk()
+
+    @staticmethod
+    def key(peer, server_pub: str, kind: str) -> str:
+        h = hashlib.sha256()
+        for part in (kind, peer.id, peer.client_private, peer.client_ip, server_pub, WG_HOST, WG_PORT, WG_DNS):
+            h.update(str(part).encode()); h.update(b"\0")
+        return f"{peer.id}-{h.hexdigest()[:32]}"
+
+    def _scan_disk(self):
+        # lo que quedó de ejecuciones anteriores entra en el LRU por antigüedad (mtime)
+        # el .conf lleva la clave privada del peer: directorio 0700 y ficheros 0600
+        self.disk.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.disk.chmod(0o700)
+        files = sorted((p for p in self.disk.iterdir() if p.is_file()), key=lambda p: p.stat().st_mtime)
+        for p in files:
+            if p.name.startswith("."):
+                p.unlink(missing_ok=True)   # .tmp a medio escribir
+                continue
+            p.chmod(0o600)
+            size = p.stat().st_size
+            self._disk_lru[p.name] = size
+            self._disk_size += size
+        with self._lock:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # llamar con _lock
+        while self._disk_size > self.max_disk_bytes and self._disk_lru:
+            old, size = self._disk_lru.popitem(last=False)
+            self._disk_size -= size
+            (self.disk / old).unlink(missing_ok=True)
+
+    def _get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._lru.get(key)
+            if data is not None:
+                self._lru.move_to_end(key)
+                return data
+        if self.disk:
+            # puede haberlo escrito otro worker: se mira el fichero aunque no esté en el índice
+            try:
+                data = (self.disk / key).read_bytes()
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                self._disk_size += len(data) - self._disk_lru.pop(key, 0)
+                self._disk_lru[key] = len(data)
+            self._put(key, data, spill=False)
+            return data
+        return None
+
+    def _put(self, key: str, data: bytes, spill: bool = True):
+        with self._lock:
+            if key in self._lru:
+                return
+            self._lru[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._lru:
+                _, old = self._lru.popitem(last=False)
+                self._size -= len(old)
+        if spill and self.disk:
+            self.disk.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp = self.disk / f".{key}.tmp"
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                f.write(data)
+            tmp.replace(self.disk / key)
+            with self._lock:
+                self._disk_size += len(data) - self._disk_lru.pop(key, 0)
+                self._disk_lru[key] = len(data)
+                self._evict_disk()
+
+    def get(self, key: str) -> bytes | None:
+        data = self._get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        self._put(key, data)
+
+    def get_or_render(self, peer, server_pub: str, kind: str) -> tuple[str, bytes]:
+        key = self.key(peer, server_pub, kind)
+        data = self.get(key)
+        if data is None:
+            data = render_artifact(peer.client_private, peer.client_ip, server_pub, kind)
+            self.put(key, data)
+        return key, data
+
+    def invalidate_peer(self, peer_id: int) -> int:
+        """ Borra de memoria y de disco todos los artefactos del peer. """
+        prefix = f"{peer_id}-"
+        with self._lock:
+            for k in [k for k in self._lru if k.startswith(prefix)]:
+                self._size -= len(self._lru.pop(k))
+            for k in [k for k in self._disk_lru if k.startswith(prefix)]:
+                self._disk_size -= self._disk_lru.pop(k)
+        if not self.disk or not self.disk.exists():
+            return 0
+        # glob y no el índice: también los que escribieron otros workers
+        removed = 0
+        for p in self.disk.glob(f"{prefix}*"):
+            p.unlink(missing_ok=True); removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear(); self._size = 0
+
+# funciones de módulo con argumentos simples: se pueden ejecutar en el pool de procesos
+def render_qr(text: str, kind: str = "png") -> bytes:
+    import qrcode, qrcode.image.svg  # PIL incluido: se carga con el primer QR
+    buf = io.BytesIO()
+    if kind == "svg":
+        qrcode.make(text, image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    else:
+        qrcode.make(text).save(buf, format="PNG")
+    return buf.getvalue()
+
+def render_artifact(client_private: str, client_ip: str, server_pub: str, kind: str) -> bytes:
+    conf = render_client_conf(client_private, client_ip, server_pub)
+    if kind == "conf":
+        return conf.encode()
+    return render_qr(conf, kind)
+
+artifacts = ArtifactCache()
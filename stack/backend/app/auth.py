@@ -1,31 +1,81 @@
-import os, time
+import os, time, hashlib, threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import jwt
-from passlib.hash import bcrypt
-import pyotp
 from fastapi import HTTPException, Response
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
+# Rotación sin cortes: JWT_KEYS="kid1:secreto1,kid2:secreto2" y JWT_ACTIVE_KID firma.
+# Los tokens se verifican con la clave de su `kid`; los antiguos sin kid, con JWT_SECRET.
+JWT_KEYS = {"default": JWT_SECRET}
+for _item in filter(None, os.getenv("JWT_KEYS", "").split(",")):
+    _kid, _, _secret = _item.strip().partition(":")
+    JWT_KEYS[_kid] = _secret
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "default")
+if JWT_ACTIVE_KID not in JWT_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID '{JWT_ACTIVE_KID}' no está en JWT_KEYS")
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "1024"))
 ACCESS_MIN = int(os.getenv("JWT_ACCESS_TTL_MIN", "15"))
 REFRESH_DAYS = int(os.getenv("JWT_REFRESH_TTL_DAYS", "7"))
 TOTP_ISSUER = os.getenv("TOTP_ISSUER", "AutoVPN")
 
+# passlib/bcrypt y pyotp se importan en el primer uso: no pesan en el arranque
 def hash_pwd(p: str) -> str:
+    from passlib.hash import bcrypt
     return bcrypt.hash(p)
 
 def verify_pwd(p: str, h: str) -> bool:
+    from passlib.hash import bcrypt
     return bcrypt.verify(p, h)
 
 def make_token(sub: str, minutes: int, kind: str, extra: Optional[dict]=None):
     now = datetime.now(timezone.utc)
     payload = {"sub": sub, "iat": int(now.timestamp()), "exp": int((now + timedelta(minutes=minutes)).timestamp()), "kind": kind}
     if extra: payload.update(extra)
-    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+    return jwt.encode(payload, JWT_KEYS[JWT_ACTIVE_KID], algorithm="HS256", headers={"kid": JWT_ACTIVE_KID})
+
+class InvalidToken(Exception):
+    pass
+
+# LRU de tokens ya verificados (por digest): los sondeos del panel no re-verifican hasta exp
+_verified: OrderedDict[bytes, dict] = OrderedDict()
+_verified_lock = threading.Lock()
+
+def decode_token(token: str, kind: str) -> dict:
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _verified_lock:
+        payload = _verified.get(digest)
+        if payload is not None:
+            if payload["exp"] > now:
+                _verified.move_to_end(digest)
+                if payload.get("kind") != kind:
+                    raise InvalidToken("wrong kind")
+                return payload
+            del _verified[digest]
+    try:
+        kid = jwt.get_unverified_header(token).get("kid", "default")
+        key = JWT_KEYS.get(kid)
+        if key is None:
+            raise InvalidToken("unknown kid")
+        payload = jwt.decode(token, key, algorithms=["HS256"])
+    except jwt.PyJWTError as e:
+        raise InvalidToken(str(e))
+    with _verified_lock:
+        _verified[digest] = payload
+        while len(_verified) > JWT_CACHE_SIZE:
+            _verified.popitem(last=False)
+    if payload.get("kind") != kind:
+        raise InvalidToken("wrong kind")
+    return payload
+
+def set_access_cookie(resp: Response, access: str):
+    resp.set_cookie("access", access, httponly=True, secure=True, samesite="lax", max_age=ACCESS_MIN*60)
 
 def set_auth_cookies(resp: Response, access: str, refresh: str):
     # Cookies seguras
-    resp.set_cookie("access", access, httponly=True, secure=True, samesite="lax", max_age=ACCESS_MIN*60)
+    set_access_cookie(resp, access)
     resp.set_cookie("refresh", refresh, httponly=True, secure=True, samesite="lax", max_age=REFRESH_DAYS*24*3600)
 
 def clear_auth_cookies(resp: Response):
@@ -33,9 +83,15 @@ def clear_auth_cookies(resp: Response):
     resp.delete_cookie("refresh")
 
 def verify_totp(secret: str, code: str) -> bool:
+    import pyotp
     totp = pyotp.TOTP(secret)
     return totp.verify(code, valid_window=1)  # ±30s
 
+def new_totp_secret() -> str:
+    import pyotp
+    return pyotp.random_base32()
+
 def provision_uri(secret: str, email: str) -> str:
+    import pyotp
     return pyotp.totp.TOTP(secret).provisioning_uri(name=email, issuer_name=TOTP_ISSUER)
 
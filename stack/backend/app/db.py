@@ -1,14 +1,185 @@
-from sqlmodel import SQLModel, create_engine, Session
-import os
+from sqlmodel import SQLModel, create_engine, Session, select
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError, ProgrammingError, IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.concurrency import run_in_threadpool
+import os, time
+from contextlib import asynccontextmanager
+from app.metrics import DB_SESSION_SECONDS
 
 DB_URL = os.getenv("DB_URL", "sqlite:///data/autovpn.db")
+# DB_ASYNC=1: rutas de peers/auth sobre el event loop (aiosqlite / asyncpg)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, echo=False, connect_args=connect_args)
+engine = create_engine(DB_URL, echo=False, connect_args=connect_args,
+                       pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+# Perfil SQLite aplicado en cada conexión (SQLITE_TUNING=0 para el modo por defecto)
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1") == "1"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",        # lectores no bloquean al escritor
+    "synchronous": "NORMAL",      # seguro con WAL; fsync solo en checkpoint
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": os.getenv("SQLITE_CACHE_KB", "-20000"),   # negativo = KiB
+    "mmap_size": os.getenv("SQLITE_MMAP_BYTES", str(128 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+}
 
-def get_session():
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    for k, v in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {k}={v}")
+    cur.close()
+
+if DB_URL.startswith("sqlite") and SQLITE_TUNING:
+    event.listen(engine, "connect", _sqlite_pragmas)
+
+def _async_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+async_engine = create_async_engine(_async_url(DB_URL), echo=False,
+                                   pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW) if DB_ASYNC else None
+if async_engine is not None and DB_URL.startswith("sqlite") and SQLITE_TUNING:
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+# Migraciones incrementales (create_all no añade índices a tablas ya existentes)
+MIGRATIONS = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS ix_peer_client_ip ON peer (client_ip)",
+        "CREATE INDEX IF NOT EXISTS ix_peer_client_public ON peer (client_public)",
+        "CREATE INDEX IF NOT EXISTS ix_peer_revoked_at ON peer (revoked_at)",
+    ]),
+]
+SCHEMA_KEY = "schema_version"
+SCHEMA_FP_KEY = "schema_fingerprint"
+# DB_SCHEMA_FORCE=1 ignora la huella guardada y repasa create_all + migraciones
+DB_SCHEMA_FORCE = os.getenv("DB_SCHEMA_FORCE", "0") == "1"
+
+def _set(s: Session, k: str, v: str):
+    # upsert: varios workers arrancando a la vez no chocan con la UNIQUE de k
+    from app.models import Settings
+    ins = (pg_insert if engine.dialect.name == "postgresql" else sqlite_insert)(Settings).values(k=k, v=v)
+    s.exec(ins.on_conflict_do_update(index_elements=["k"], set_={"v": v}))
+
+def migrate():
+    from app.models import Settings
+    with Session(engine) as s:
+        row = s.exec(select(Settings).where(Settings.k == SCHEMA_KEY)).first()
+        current = int(row.v) if row else 0
+        for version, stmts in MIGRATIONS:
+            if version <= current:
+                continue
+            for sql in stmts:
+                s.exec(text(sql))
+            current = version
+        _set(s, SCHEMA_KEY, str(current)); s.commit()
+
+def schema_fingerprint() -> str:
+    """ Huella de tablas/columnas/índices de los modelos + última migración. """
+    import hashlib
+    import app.models  # noqa: F401  (registra las tablas en metadata)
+    parts = [str(MIGRATIONS[-1][0])]
+    for t in sorted(SQLModel.metadata.tables.values(), key=lambda t: t.name):
+        cols = ",".join(f"{c.name}:{type(c.type).__name__}" for c in t.columns)
+        idx = ",".join(sorted(i.name for i in t.indexes))
+        parts.append(f"{t.name}({cols})[{idx}]")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+def _schema_current(fp: str) -> bool:
+    # una sola consulta; si la tabla settings aún no existe, el esquema no está listo
+    try:
+        with engine.connect() as c:
+            row = c.execute(text("SELECT v FROM settings WHERE k = :k"), {"k": SCHEMA_FP_KEY}).first()
+    except Exception:
+        return False
+    return row is not None and row[0] == fp
+
+def init_db() -> bool:
+    """
+    Crea/migra el esquema solo si la huella guardada no coincide con la de los
+    modelos: en un arranque normal cuesta un SELECT en vez de inspeccionar cada
+    tabla. Devuelve True si ha tenido que aplicar cambios.
+    """
+    fp = schema_fingerprint()
+    if not DB_SCHEMA_FORCE and _schema_current(fp):
+        return False
+    for attempt in range(5):
+        try:
+            SQLModel.metadata.create_all(engine)
+            break
+        except (OperationalError, ProgrammingError, IntegrityError):
+            # otro worker creó una tabla entre la comprobación y el CREATE; checkfirst ya la verá
+            if attempt == 4:
+                raise
+    migrate()
     with Session(engine) as s:
-        yield s
+        _set(s, SCHEMA_FP_KEY, fp); s.commit()
+    return True
+
+def get_session():
+    t0 = time.perf_counter()
+    try:
+        with Session(engine) as s:
+            yield s
+    finally:
+        DB_SESSION_SECONDS.labels("sync").observe(time.perf_counter() - t0)
+
+class Db:
+    """
+    Sesión con la misma API awaitable en los dos modos: en DB_ASYNC usa
+    AsyncSession; si no, ejecuta la Session síncrona en el threadpool solo
+    durante cada consulta (no durante toda la petición).
+    """
+    def __init__(self, s, is_async: bool):
+        self.s = s
+        self.is_async = is_async
+
+    async def _call(self, name: str, *args):
+        fn = getattr(self.s, name)
+        return await fn(*args) if self.is_async else await run_in_threadpool(fn, *args)
+
+    async def exec(self, stmt):
+        return await self._call("exec", stmt)
+
+    async def get(self, model, ident):
+        return await self._call("get", model, ident)
+
+    async def commit(self):
+        await self._call("commit")
+
+    async def refresh(self, obj):
+        await self._call("refresh", obj)
+
+    def add(self, obj):
+        self.s.add(obj)
+
+@asynccontextmanager
+async def db_session():
+    t0 = time.perf_counter()
+    try:
+        if async_engine is not None:
+            async with AsyncSession(async_engine, expire_on_commit=False) as s:
+                yield Db(s, True)
+        else:
+            s = Session(engine, expire_on_commit=False)
+            try:
+                yield Db(s, False)
+            finally:
+                await run_in_threadpool(s.close)
+    finally:
+        DB_SESSION_SECONDS.labels("async" if async_engine is not None else "threadpool").observe(time.perf_counter() - t0)
 
+async def get_db():
+    async with db_session() as db:
+        yield db
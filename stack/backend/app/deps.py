@@ -1,16 +1,18 @@
-from fastapi import Cookie, HTTPException, status
-import jwt, os
-
-JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
+import os
+from fastapi import Cookie, Depends, HTTPException, status
+from app.auth import decode_token, InvalidToken
 
 def current_user_email(access: str | None = Cookie(default=None)):
     if not access:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     try:
-        payload = jwt.decode(access, JWT_SECRET, algorithms=["HS256"])
-        if payload.get("kind") != "access":
-            raise Exception("wrong kind")
-        return payload["sub"]
-    except Exception:
+        return decode_token(access, "access")["sub"]
+    except (InvalidToken, KeyError):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
+def require_admin(email: str = Depends(current_user_email)):
+    # operaciones delicadas (profiler): solo la cuenta ADMIN_EMAIL; sin ella configurada, nadie
+    admin = os.getenv("ADMIN_EMAIL")
+    if not admin or email.lower() != admin.lower():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return email
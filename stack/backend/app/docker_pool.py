@@ -0,0 +1,94 @@
+import os, time, threading
+from collections import deque
+from typing import Optional
+
+DOCKER_POOL_SIZE = int(os.getenv("DOCKER_POOL_SIZE", "10"))
+DOCKER_TIMEOUT = int(os.getenv("DOCKER_TIMEOUT", "30"))
+METRICS_WINDOW = int(os.getenv("DOCKER_METRICS_WINDOW", "1024"))
+
+class DockerPool:
+    """
+    Cliente Docker de larga vida (una sola conexión HTTP reutilizable a docker.sock)
+    con el handle del contenedor en caché. Si el contenedor se recrea (NotFound
+    sobre el id cacheado), se invalida el handle y se reintenta una vez.
+    """
+    def __init__(self, container_name: str):
+        self.container_name = container_name
+        self._lock = threading.Lock()      # cliente / handle
+        self._stats = threading.Lock()     # latencias (lo toma _timed, también bajo _lock)
+        self._client: Optional["docker.DockerClient"] = None
+        self._container = None
+        self._lat: dict[str, deque] = {}
+        self._count: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+
+    # --- cliente / handle ---
+    def client(self) -> "docker.DockerClient":
+        with self._lock:
+            if self._client is None:
+                import docker  # ~200 ms de import: solo cuando se habla con docker.sock
+                self._client = docker.from_env(max_pool_size=DOCKER_POOL_SIZE, timeout=DOCKER_TIMEOUT)
+            return self._client
+
+    def container(self):
+        c = self._container
+        if c is not None:
+            return c
+        cli = self.client()
+        with self._lock:
+            if self._container is None:
+                self._container = self._timed("inspect", lambda: cli.containers.get(self.container_name))
+            return self._container
+
+    def invalidate(self):
+        with self._lock:
+            self._container = None
+
+    def call(self, op: str, fn):
+        """
+        Ejecuta fn(container) midiendo latencia. Reintenta una vez si el id
+        cacheado ya no existe (contenedor recreado).
+        """
+        from docker.errors import NotFound
+        try:
+            return self._timed(op, lambda: fn(self.container()))
+        except NotFound:
+            self.invalidate()
+            return self._timed(op, lambda: fn(self.container()))
+
+    def exec_run(self, cmd: list[str]):
+        return self.call("exec", lambda c: c.exec_run(cmd, stdout=True, stderr=True))
+
+    # --- métricas ---
+    def _timed(self, op: str, fn):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            res = fn()
+            ok = True
+            return res
+        finally:
+            dt = time.perf_counter() - t0
+            with self._stats:
+                self._lat.setdefault(op, deque(maxlen=METRICS_WINDOW)).append(dt)
+                self._count[op] = self._count.get(op, 0) + 1
+                if not ok:
+                    self._errors[op] = self._errors.get(op, 0) + 1
+
+    def metrics(self) -> dict:
+        with self._stats:
+            snap = {op: sorted(v) for op, v in self._lat.items()}
+            counts = dict(self._count); errors = dict(self._errors)
+        out = {}
+        for op, lat in snap.items():
+            n = len(lat)
+            pick = lambda q: round(lat[min(n - 1, int(q * n))] * 1000, 3) if n else None
+            out[op] = {
+                "count": counts.get(op, 0),
+                "errors": errors.get(op, 0),
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": round(lat[-1] * 1000, 3) if n else None,
+            }
+        return out
@@ -0,0 +1,104 @@
+import os, time, json, asyncio, logging
+from app.wg import wg_dump
+
+EVENTS_INTERVAL = float(os.getenv("WG_EVENTS_INTERVAL", "5"))   # segundos entre muestras
+EVENTS_QUEUE = int(os.getenv("WG_EVENTS_QUEUE", "32"))          # mensajes por suscriptor
+# WireGuard re-negocia cada 2 min: sin handshake en 3 min => peer caído
+PEER_UP_SECONDS = int(os.getenv("WG_PEER_UP_SECONDS", "180"))
+
+log = logging.getLogger("autovpn.events")
+
+class LiveFeed:
+    """
+    Un único muestreador de `wg show wg0 dump` compartido por todos los
+    suscriptores SSE: el número de execs no depende de cuántos paneles
+    haya abiertos. Solo corre mientras hay alguien suscrito.
+    Cada suscriptor tiene una cola acotada; si se llena se vacía y recibe un
+    `snapshot` nuevo para que el cliente reconstruya su estado.
+    """
+    def __init__(self, interval: float = EVENTS_INTERVAL, queue_size: int = EVENTS_QUEUE):
+        self.interval = interval
+        self.queue_size = queue_size
+        self._subs: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+        self._prev: dict[str, dict] = {}
+        self.dropped = 0
+        self.resyncs = 0
+
+    def _snapshot(self) -> str:
+        snap = {"ts": int(time.time()), "peers": list(self._prev.values())}
+        return f"event: snapshot\ndata: {json.dumps(snap)}\n\n"
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.queue_size))
+        if self._prev:
+            # estado actual para quien se incorpora tarde; luego solo deltas
+            q.put_nowait(self._snapshot())
+        self._subs.add(q)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        self._subs.discard(q)
+        if not self._subs and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._prev = {}
+
+    def _publish(self, msg: str):
+        snap = None
+        for q in list(self._subs):
+            if q.full():
+                # suscriptor lento: sus deltas pendientes ya no sirven; se descartan y se
+                # sustituyen por un snapshot (que ya incluye `msg`), sin bloquear al resto
+                self.dropped += q.qsize()
+                while not q.empty():
+                    q.get_nowait()
+                snap = snap or self._snapshot()
+                q.put_nowait(snap)
+                self.resyncs += 1
+            else:
+                q.put_nowait(msg)
+
+    def _diff(self, peers: list[dict], now: int) -> dict:
+        changes, transitions = [], []
+        cur = {}
+        for p in peers:
+            pub = p["public_key"]
+            up = p["latest_handshake"] > 0 and now - p["latest_handshake"] < PEER_UP_SECONDS
+            cur[pub] = {**p, "up": up}
+            old = self._prev.get(pub)
+            if old is None:
+                changes.append({"public_key": pub, "latest_handshake": p["latest_handshake"],
+                                "rx_delta": 0, "tx_delta": 0})
+            else:
+                drx = p["rx_bytes"] - old["rx_bytes"]
+                dtx = p["tx_bytes"] - old["tx_bytes"]
+                if drx or dtx or p["latest_handshake"] != old["latest_handshake"]:
+                    changes.append({"public_key": pub, "latest_handshake": p["latest_handshake"],
+                                    "rx_delta": max(drx, 0), "tx_delta": max(dtx, 0)})
+            if old is None or old["up"] != up:
+                transitions.append({"public_key": pub, "state": "up" if up else "down"})
+        for pub, old in self._prev.items():
+            if pub not in cur and old["up"]:
+                transitions.append({"public_key": pub, "state": "down"})
+        self._prev = cur
+        return {"ts": now, "peers": changes, "transitions": transitions}
+
+    async def _run(self):
+        while True:
+            try:
+                peers = await asyncio.to_thread(wg_dump)
+                ev = self._diff(peers, int(time.time()))
+                # sin cambios no se encola nada: el keepalive lo pone el endpoint SSE
+                if ev["peers"] or ev["transitions"]:
+                    self._publish(f"event: peers\ndata: {json.dumps(ev)}\n\n")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("events sample failed: %s", e)
+                self._publish(f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n")
+            await asyncio.sleep(self.interval)
+
+feed = LiveFeed()
@@ -0,0 +1,79 @@
+import ipaddress, os
+from sqlmodel import Session, select, update, delete
+from app.models import Peer, Settings, FreeIp
+from app.wg import WG_SUBNET
+
+# Asignación de IPs de clientes dentro de WG_SUBNET.
+# Estado persistido: Settings["ip_next"] (marca de agua, offset sobre la red)
+# + tabla FreeIp con los offsets liberados por peers revocados.
+# Asignar/liberar cuesta O(1) (lectura por PK), sin recorrer la tabla Peer.
+
+NETWORK = ipaddress.ip_network(WG_SUBNET, strict=False)
+# .1 es el servidor; por compatibilidad los clientes empiezan en .10
+FIRST_OFFSET = max(2, int(os.getenv("WG_IP_START", "10")))
+LAST_OFFSET = NETWORK.num_addresses - 2  # sin broadcast
+NEXT_KEY = "ip_next"
+
+def _offset(ip_cidr: str) -> int | None:
+    ip = ipaddress.ip_address(ip_cidr.split("/")[0])
+    if ip not in NETWORK:
+        return None
+    return int(ip) - int(NETWORK.network_address)
+
+def _address(offset: int) -> str:
+    return f"{NETWORK.network_address + offset}/32"
+
+def init_ipam(s: Session):
+    """
+    Crea el estado del asignador si no existe. La primera vez migra los peers
+    existentes: marca de agua tras la IP más alta y libera las de revocados.
+    """
+    if s.exec(select(Settings).where(Settings.k == NEXT_KEY)).first():
+        return
+    nxt = FIRST_OFFSET
+    revoked: set[int] = set()
+    active: set[int] = set()
+    for ip, revoked_at in s.exec(select(Peer.client_ip, Peer.revoked_at)).all():
+        off = _offset(ip)
+        if off is None:
+            continue
+        nxt = max(nxt, off + 1)
+        (revoked if revoked_at is not None else active).add(off)
+    for off in revoked - active:
+        s.add(FreeIp(offset=off))
+    s.add(Settings(k=NEXT_KEY, v=str(nxt)))
+    s.commit()
+
+def allocate_ips(s: Session, n: int = 1) -> list[str]:
+    """
+    Reserva n direcciones dentro de la transacción de `s` (el llamante hace commit).
+    Reutiliza primero las liberadas y luego avanza la marca de agua.
+    """
+    init_ipam(s)
+    # el UPDATE inicial toma el bloqueo de escritura: serializa asignaciones concurrentes
+    s.exec(update(Settings).where(Settings.k == NEXT_KEY).values(v=Settings.v))
+    reused = s.exec(select(FreeIp.offset).order_by(FreeIp.offset).limit(n)).all()
+    if reused:
+        s.exec(delete(FreeIp).where(FreeIp.offset.in_(reused)))
+    missing = n - len(reused)
+    fresh: list[int] = []
+    if missing:
+        row = s.exec(select(Settings).where(Settings.k == NEXT_KEY)).one()
+        nxt = int(row.v)
+        if nxt + missing - 1 > LAST_OFFSET:
+            raise RuntimeError(f"No hay IPs libres en el pool {NETWORK}")
+        fresh = list(range(nxt, nxt + missing))
+        row.v = str(nxt + missing)
+        s.add(row)
+    return [_address(o) for o in [*reused, *fresh]]
+
+def allocate_ip(s: Session) -> str:
+    return allocate_ips(s, 1)[0]
+
+def release_ip(s: Session, ip_cidr: str):
+    """ Devuelve la IP al pool (mismo commit que la revocación). """
+    off = _offset(ip_cidr)
+    if off is None or off < FIRST_OFFSET or off > LAST_OFFSET:
+        return
+    if s.get(FreeIp, off) is None:
+        s.add(FreeIp(offset=off))
@@ -1,29 +1,78 @@
-import io, qrcode, os, pyotp
-from fastapi import FastAPI, Depends, HTTPException, status, Response, Body
+import os, time, asyncio, json, logging
+_IMPORT_T0 = time.perf_counter()
+from datetime import datetime
+from fastapi import FastAPI, Depends, HTTPException, status, Response, Body, Request, Cookie
 from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from sqlmodel import select
-from app.db import init_db, get_session
+from app.db import init_db, get_session, get_db, db_session, Db
 from app.models import User, Peer
 from app.auth import *
-from app.deps import current_user_email
-from app.wg import gen_keypair, server_public_key, add_peer, remove_peer, render_client_conf, allocate_ip
+from app.deps import current_user_email, require_admin
+from app.wg import gen_keypair, gen_keypairs, server_public_key, add_peer, add_peers, remove_peer, render_client_conf
+from app.ipam import init_ipam, allocate_ip, allocate_ips, release_ip
 from sqlmodel import Session
 from app.db import engine, Session
 from fastapi import Query
-from .wg import container_control, wg_show
+from .wg import container_control, wg_show, wg_dump, docker_metrics
+from .reconcile import reconciler
+from .traffic import sampler, query_traffic, STEPS
+from .events import feed
+from .artifacts import artifacts, MEDIA, render_artifact, render_qr
+from .workers import cpu
+from .ratelimit import limiter
+from . import metrics
+from .profiler import profiler
+from starlette.concurrency import run_in_threadpool
 
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_T0
+log = logging.getLogger("autovpn.startup")
+# informe de arranque en frío: import de la app + cada fase del hook de startup
+STARTUP = {"import_s": round(IMPORT_SECONDS, 4), "phases": {}, "schema_applied": None, "total_s": None}
 
 app = FastAPI(title="AutoVPN API")
+app.add_middleware(metrics.HttpMetrics)
+
+BULK_MAX = int(os.getenv("PEERS_BULK_MAX", "1000"))
+EXPORT_BATCH = int(os.getenv("PEERS_EXPORT_BATCH", "1000"))
+
+def _phase(name: str, fn):
+    t0 = time.perf_counter()
+    res = fn()
+    STARTUP["phases"][name] = round(time.perf_counter() - t0, 4)
+    return res
+
+def _init_ipam():
+    with Session(engine) as s:
+        init_ipam(s)
 
 @app.on_event("startup")
 def _startup():
-    init_db()
-    seed_admin()
+    t0 = time.perf_counter()
+    STARTUP["schema_applied"] = _phase("init_db", init_db)
+    _phase("seed_admin", seed_admin)
+    _phase("ipam", _init_ipam)
+    # primera pasada al arrancar y luego cada WG_RECONCILE_INTERVAL (en sus hilos)
+    _phase("workers", lambda: (reconciler.start(), sampler.start()))
+    STARTUP["total_s"] = round(time.perf_counter() - t0, 4)
+    metrics.observe_startup(STARTUP)
+    log.info("startup: import %.3fs, hooks %.3fs %s", IMPORT_SECONDS, STARTUP["total_s"], STARTUP["phases"])
+
+@app.on_event("shutdown")
+def _shutdown():
+    reconciler.stop()
+    sampler.stop()
+    cpu.shutdown()
 
 @app.get("/health")
 def health():
     return {"status":"ok"}
 
+@app.get("/metrics")
+def prometheus_metrics():
+    # formato texto Prometheus; no pasa por Caddy (solo red interna)
+    body, ctype = metrics.render()
+    return Response(content=body, media_type=ctype)
+
 def seed_admin():
     admin_email = os.getenv("ADMIN_EMAIL")
     admin_hash  = os.getenv("ADMIN_PASSWORD_HASH")
@@ -41,28 +90,211 @@ def api_status(email=Depends(current_user_email)):
     # Señal mínima de vida
     return {"api":"ok"}
 
+STATUS_SORT = {
+    "handshake": lambda p: p["latest_handshake"],
+    "rx": lambda p: p["rx_bytes"],
+    "tx": lambda p: p["tx_bytes"],
+}
+
+@app.get("/api/workers")
+def workers_metrics(email=Depends(current_user_email)):
+    # cola y espera del pool CPU (bcrypt/QR)
+    return cpu.metrics()
+
+@app.get("/api/startup")
+def startup_report(email=Depends(current_user_email)):
+    return STARTUP
+
+@app.get("/api/ratelimit")
+def ratelimit_metrics(email=Depends(current_user_email)):
+    return limiter.metrics()
+
+@app.post("/api/profiler/start")
+def profiler_start(seconds: int = Query(30, ge=1), interval_ms: int = Query(10, ge=1, le=1000),
+                   app_only: bool = Query(True), email=Depends(require_admin)):
+    # ventana acotada (PROFILER_MAX_SECONDS); se apaga sola al vencer
+    try:
+        return profiler.start(seconds, interval_ms, app_only)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/api/profiler/stop")
+def profiler_stop(email=Depends(require_admin)):
+    return profiler.stop()
+
+@app.get("/api/profiler")
+def profiler_status(email=Depends(require_admin)):
+    return profiler.status()
+
+@app.get("/api/profiler/collapsed")
+def profiler_collapsed(email=Depends(require_admin)):
+    headers = {"Content-Disposition": 'attachment; filename="autovpn.collapsed"'}
+    return PlainTextResponse(content=profiler.collapsed(), headers=headers)
+
 @app.get("/api/wireguard/status")
-def wireguard_status(email=Depends(current_user_email)):
-    return wg_show()
+def wireguard_status(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    active_minutes: int | None = Query(None, ge=1),
+    sort: str = Query("handshake"),
+    raw: bool = Query(False),
+    email=Depends(current_user_email),
+    s: Session = Depends(get_session),
+):
+    if raw:
+        # salida textual previa de `wg show`
+        return wg_show()
+    if sort not in STATUS_SORT:
+        raise HTTPException(status_code=400, detail="invalid sort")
+    peers = wg_dump()
+    if active_minutes:
+        since = int(time.time()) - active_minutes * 60
+        peers = [p for p in peers if p["latest_handshake"] >= since]
+    peers.sort(key=STATUS_SORT[sort], reverse=True)
+    page = peers[offset:offset + limit]
+    # nombres solo para la página devuelta
+    pubs = [p["public_key"] for p in page]
+    names = dict(s.exec(select(Peer.client_public, Peer.name).where(Peer.client_public.in_(pubs))).all()) if pubs else {}
+    for p in page:
+        p["name"] = names.get(p["public_key"])
+    return {"total": len(peers), "offset": offset, "limit": limit, "peers": page}
+
+@app.get("/api/wireguard/events")
+async def wireguard_events(request: Request, email=Depends(current_user_email)):
+    # SSE: handshakes, deltas rx/tx y transiciones up/down desde un muestreador compartido
+    q = feed.subscribe()
+    async def _stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(q.get(), timeout=30)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            feed.unsubscribe(q)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(_stream(), media_type="text/event-stream", headers=headers)
+
+@app.get("/api/wireguard/docker-metrics")
+def wireguard_docker_metrics(email=Depends(current_user_email)):
+    # latencias por operación contra docker.sock (p50/p95/p99)
+    return docker_metrics()
+
+@app.post("/api/wireguard/server-key/refresh")
+def wireguard_server_key_refresh(email=Depends(current_user_email)):
+    # tras re-keyear wg0 fuera del panel
+    return {"public_key": server_public_key(refresh=True)}
+
+@app.get("/api/wireguard/reconcile")
+def wireguard_reconcile_stats(email=Depends(current_user_email)):
+    return reconciler.stats
+
+@app.post("/api/wireguard/reconcile")
+def wireguard_reconcile(email=Depends(current_user_email)):
+    try:
+        return reconciler.run_once()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"reconcile failed: {e}")
 
 @app.post("/api/wireguard/{action}")
 def wireguard_action(action: str, email=Depends(current_user_email)):
     if action not in {"start","stop","restart"}:
         raise HTTPException(status_code=400, detail="invalid action")
-    return container_control(action)
+    res = container_control(action)
+    if action != "stop":
+        # el reinicio pierde los peers añadidos en caliente
+        reconciler.trigger()
+    return res
+
+PEER_COLUMNS = (Peer.id, Peer.name, Peer.client_ip, Peer.revoked_at, Peer.created_at)
+
+def _peer_query(after: int, limit: int, revoked: bool | None, name_prefix: str | None,
+                created_from: datetime | None, created_to: datetime | None):
+    # solo columnas públicas (nunca client_private); paginación por id (keyset)
+    q = select(*PEER_COLUMNS).where(Peer.id > after)
+    if revoked is not None:
+        q = q.where(Peer.revoked_at != None if revoked else Peer.revoked_at == None)  # noqa: E711
+    if name_prefix:
+        q = q.where(Peer.name.startswith(name_prefix, autoescape=True))
+    if created_from:
+        q = q.where(Peer.created_at >= created_from)
+    if created_to:
+        q = q.where(Peer.created_at < created_to)
+    return q.order_by(Peer.id).limit(limit)
+
+def _peer_row(r) -> dict:
+    return {"id": r.id, "name": r.name, "ip": r.client_ip, "revoked": r.revoked_at is not None, "created_at": r.created_at}
 
 @app.get("/api/peers")
-def list_peers(email=Depends(current_user_email), s: Session = Depends(get_session)):
-    # listado simple
-    q = s.exec(select(Peer)).all()
-    return [{"id":p.id,"name":p.name,"ip":p.client_ip,"revoked":p.revoked_at is not None,"created_at":p.created_at} for p in q]
+async def list_peers(
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    revoked: bool | None = Query(None),
+    name_prefix: str | None = Query(None),
+    created_from: datetime | None = Query(None),
+    created_to: datetime | None = Query(None),
+    email=Depends(current_user_email),
+    db: Db = Depends(get_db),
+):
+    rows = (await db.exec(_peer_query(cursor, limit, revoked, name_prefix, created_from, created_to))).all()
+    items = [_peer_row(r) for r in rows]
+    return {"items": items, "next_cursor": items[-1]["id"] if len(items) == limit else None}
+
+@app.get("/api/peers/export")
+async def export_peers(
+    revoked: bool | None = Query(None),
+    name_prefix: str | None = Query(None),
+    created_from: datetime | None = Query(None),
+    created_to: datetime | None = Query(None),
+    email=Depends(current_user_email),
+):
+    # NDJSON por lotes: memoria constante aunque haya decenas de miles de peers
+    async def _stream():
+        after = 0
+        async with db_session() as db:
+            while True:
+                rows = (await db.exec(_peer_query(after, EXPORT_BATCH, revoked, name_prefix, created_from, created_to))).all()
+                if not rows:
+                    break
+                yield "".join(json.dumps(_peer_row(r), default=datetime.isoformat) + "\n" for r in rows)
+                after = rows[-1].id
+    return StreamingResponse(_stream(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": 'attachment; filename="peers.ndjson"'})
+
+
+@app.get("/api/peers/{peer_id}/traffic")
+def peer_traffic(
+    peer_id: int,
+    t_from: int | None = Query(None, alias="from"),
+    t_to: int | None = Query(None, alias="to"),
+    step: str | None = Query(None),
+    email=Depends(current_user_email),
+    s: Session = Depends(get_session),
+):
+    # responde desde los rollups (epoch en segundos); step por defecto según el rango
+    t_to = t_to or int(time.time())
+    t_from = t_from if t_from is not None else t_to - 86400
+    if t_from > t_to:
+        raise HTTPException(status_code=400, detail="from > to")
+    if step is None:
+        span = t_to - t_from
+        step = "minute" if span <= 6*3600 else "hour" if span <= 14*86400 else "day"
+    if step not in STEPS:
+        raise HTTPException(status_code=400, detail="invalid step")
+    if not s.get(Peer, peer_id):
+        raise HTTPException(status_code=404)
+    points = query_traffic(s, peer_id, t_from, t_to, STEPS[step])
+    return {"peer_id": peer_id, "step": step, "from": t_from, "to": t_to, "points": points}
 
 
 # --- login / totp ---
 @app.post("/auth/login")
-def login(email: str = Body(...), password: str = Body(...), s: Session = Depends(get_session)):
-    u = s.exec(select(User).where(User.email==email)).first()
-    if not u or not verify_pwd(password, u.password_hash):
+async def login(request: Request, email: str = Body(...), password: str = Body(...), db: Db = Depends(get_db)):
+    # throttling antes de tocar BD o bcrypt
+    await limiter.check(request, email)
+    u = (await db.exec(select(User).where(User.email==email))).first()
+    # bcrypt en el pool CPU: no ocupa el threadpool de FastAPI
+    if not u or not await cpu.run(verify_pwd, password, u.password_hash):
         raise HTTPException(status_code=401, detail="invalid credentials")
     if u.totp_enabled:
         temp = make_token(u.email, minutes=5, kind="mfa_tmp")
@@ -75,52 +307,67 @@ def login(email: str = Body(...), password: str = Body(...), s: Session = Depend
     return resp
 
 @app.post("/auth/mfa/verify")
-def mfa_verify(code: str = Body(...), temp_token: str = Body(...), s: Session = Depends(get_session)):
+async def mfa_verify(request: Request, code: str = Body(...), temp_token: str = Body(...), db: Db = Depends(get_db)):
     try:
-        payload = jwt.decode(temp_token, JWT_SECRET, algorithms=["HS256"])
-        if payload.get("kind") != "mfa_tmp":
-            raise Exception("wrong kind")
-        email = payload["sub"]
-    except Exception:
+        email = decode_token(temp_token, "mfa_tmp")["sub"]
+    except (InvalidToken, KeyError):
+        email = None
+    await limiter.check(request, email)
+    if email is None:
         raise HTTPException(status_code=401, detail="invalid token")
-    u = s.exec(select(User).where(User.email==email)).first()
+    u = (await db.exec(select(User).where(User.email==email))).first()
     if not u or not u.totp_enabled or not u.totp_secret:
         raise HTTPException(status_code=401, detail="mfa not enabled")
     if not verify_totp(u.totp_secret, code):
         raise HTTPException(status_code=401, detail="bad mfa code")
-    access = make_token(email, ACCESS_MIN, "access", extra={"mfa_time": int(time.time())})
-    refresh = make_token(email, REFRESH_DAYS*24*60, "refresh")
+    mfa = {"mfa_time": int(time.time())}
+    access = make_token(email, ACCESS_MIN, "access", extra=mfa)
+    refresh = make_token(email, REFRESH_DAYS*24*60, "refresh", extra=mfa)
     resp = JSONResponse({"ok": True})
     set_auth_cookies(resp, access, refresh)
     return resp
 
 @app.post("/auth/totp/enroll")
-def totp_enroll(password: str = Body(...), email=Depends(current_user_email), s: Session = Depends(get_session)):
-    u = s.exec(select(User).where(User.email==email)).first()
-    if not u or not verify_pwd(password, u.password_hash):
+async def totp_enroll(password: str = Body(...), email=Depends(current_user_email), db: Db = Depends(get_db)):
+    u = (await db.exec(select(User).where(User.email==email))).first()
+    if not u or not await cpu.run(verify_pwd, password, u.password_hash):
         raise HTTPException(status_code=401)
     if u.totp_enabled:
         raise HTTPException(status_code=400, detail="already enabled")
-    secret = pyotp.random_base32()
+    secret = new_totp_secret()
     u.totp_secret = secret
-    s.add(u); s.commit()
+    db.add(u); await db.commit()
     uri = provision_uri(secret, u.email)
     # devuelvo QR png in-line
-    img = qrcode.make(uri)
-    buf = io.BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+    png = await cpu.run(render_qr, uri)
+    return Response(content=png, media_type="image/png")
 
 @app.post("/auth/totp/enable")
-def totp_enable(code: str = Body(...), email=Depends(current_user_email), s: Session = Depends(get_session)):
-    u = s.exec(select(User).where(User.email==email)).first()
+async def totp_enable(code: str = Body(...), email=Depends(current_user_email), db: Db = Depends(get_db)):
+    u = (await db.exec(select(User).where(User.email==email))).first()
     if not u or not u.totp_secret:
         raise HTTPException(status_code=400)
     if not verify_totp(u.totp_secret, code):
         raise HTTPException(status_code=401)
     u.totp_enabled = True
-    s.add(u); s.commit()
+    db.add(u); await db.commit()
     return {"enabled": True}
 
+@app.post("/auth/refresh")
+def refresh_token(refresh: str | None = Cookie(default=None)):
+    # nuevo access a partir del refresh: solo firma, sin consultar la BD
+    if not refresh:
+        raise HTTPException(status_code=401)
+    try:
+        payload = decode_token(refresh, "refresh")
+    except InvalidToken:
+        raise HTTPException(status_code=401)
+    extra = {"mfa_time": payload["mfa_time"]} if "mfa_time" in payload else None
+    access = make_token(payload["sub"], ACCESS_MIN, "access", extra=extra)
+    resp = JSONResponse({"ok": True})
+    set_access_cookie(resp, access)
+    return resp
+
 @app.post("/auth/logout")
 def logout():
     resp = JSONResponse({"ok": True})
@@ -130,34 +377,75 @@ def logout():
 # --- peers ---
 @app.post("/peers")
 def create_peer(name: str = Body(...), email=Depends(current_user_email), s: Session = Depends(get_session)):
-    # muy simple: siguiente IP = 10.13.13.X/32 donde X = 10 + count
-    count = s.exec(select(Peer)).count() if hasattr(s, "count") else len(s.exec(select(Peer)).all())
     client_priv, client_pub = gen_keypair()
     server_pub = server_public_key()
-    client_ip_cidr = allocate_ip(10 + count)
+    client_ip_cidr = allocate_ip(s)
     add_peer(server_pub, client_pub, client_ip_cidr)
     peer = Peer(user_id=0, name=name, client_private=client_priv, client_public=client_pub, client_ip=client_ip_cidr)
     s.add(peer); s.commit(); s.refresh(peer)
     return {"id": peer.id, "name": name, "ip": peer.client_ip}
 
-@app.get("/peers/{peer_id}/config")
-def download_conf(peer_id: int, email=Depends(current_user_email), s: Session = Depends(get_session)):
+@app.post("/peers/bulk")
+def create_peers_bulk(names: list[str] = Body(..., embed=True), email=Depends(current_user_email), s: Session = Depends(get_session)):
+    # alta de equipos completos: claves en proceso, IPs en una transacción, un solo commit y un solo `wg set`
+    if not names:
+        raise HTTPException(status_code=400, detail="empty names")
+    if len(names) > BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"max {BULK_MAX} peers per request")
+    keys = gen_keypairs(len(names))
+    ips = allocate_ips(s, len(names))
+    peers = [Peer(user_id=0, name=n, client_private=priv, client_public=pub, client_ip=ip)
+             for n, (priv, pub), ip in zip(names, keys, ips)]
+    s.add_all(peers); s.flush()
+    add_peers([(p.client_public, p.client_ip) for p in peers])
+    s.commit()
+    return [{"id": p.id, "name": p.name, "ip": p.client_ip} for p in peers]
+
+@app.delete("/peers/{peer_id}")
+def revoke_peer(peer_id: int, email=Depends(current_user_email), s: Session = Depends(get_session)):
     peer = s.get(Peer, peer_id)
     if not peer or peer.revoked_at is not None:
         raise HTTPException(status_code=404)
-    server_pub = server_public_key()
-    conf = render_client_conf(peer.client_private, peer.client_ip, server_pub)
+    remove_peer(peer.client_public)
+    peer.revoked_at = datetime.utcnow()
+    release_ip(s, peer.client_ip)
+    s.add(peer); s.commit()
+    # el .conf cacheado lleva la clave privada del peer
+    artifacts.invalidate_peer(peer.id)
+    return {"id": peer.id, "revoked": True}
+
+async def _artifact(request: Request, peer, kind: str, headers: dict | None = None) -> Response:
+    # .conf/QR desde caché; If-None-Match -> 304 sin renderizar ni leer la caché
+    server_pub = await run_in_threadpool(server_public_key)
+    key = artifacts.key(peer, server_pub, kind)
+    etag = f'"{key}"'
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    # con volcado a disco get/put leen y escriben ficheros: al threadpool, no en el event loop
+    data = await run_in_threadpool(artifacts.get, key) if artifacts.disk else artifacts.get(key)
+    if data is None:
+        # el render del QR es CPU puro: al pool dedicado
+        data = await cpu.run(render_artifact, peer.client_private, peer.client_ip, server_pub, kind)
+        if artifacts.disk:
+            await run_in_threadpool(artifacts.put, key, data)
+        else:
+            artifacts.put(key, data)
+    return Response(content=data, media_type=MEDIA[kind], headers=headers)
+
+@app.get("/peers/{peer_id}/config")
+async def download_conf(peer_id: int, request: Request, email=Depends(current_user_email), db: Db = Depends(get_db)):
+    peer = await db.get(Peer, peer_id)
+    if not peer or peer.revoked_at is not None:
+        raise HTTPException(status_code=404)
     headers = {"Content-Disposition": f'attachment; filename="AutoVPN-{peer.name}.conf"'}
-    return PlainTextResponse(content=conf, headers=headers)
+    return await _artifact(request, peer, "conf", headers)
 
 @app.get("/peers/{peer_id}/qr")
-def download_qr(peer_id: int, email=Depends(current_user_email), s: Session = Depends(get_session)):
-    peer = s.get(Peer, peer_id)
+async def download_qr(peer_id: int, request: Request, format: str = Query("png"), email=Depends(current_user_email), db: Db = Depends(get_db)):
+    if format not in {"png","svg"}:
+        raise HTTPException(status_code=400, detail="invalid format")
+    peer = await db.get(Peer, peer_id)
     if not peer or peer.revoked_at is not None:
         raise HTTPException(status_code=404)
-    server_pub = server_public_key()
-    conf = render_client_conf(peer.client_private, peer.client_ip, server_pub)
-    img = qrcode.make(conf)
-    buf = io.BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
-
+    return await _artifact(request, peer, format)
@@ -0,0 +1,98 @@
+import os, time, threading
+from prometheus_client import Histogram, Gauge, CONTENT_TYPE_LATEST, generate_latest
+
+# Métricas Prometheus (GET /metrics, solo red interna: Caddy publica únicamente /api/*).
+# Histogramas con buckets fijos: observar cuesta un bisect + un incremento.
+
+REQUEST_SECONDS = Histogram("autovpn_http_request_duration_seconds", "Latencia por ruta",
+                            ["method", "route", "status"])
+DOCKER_EXEC_SECONDS = Histogram("autovpn_docker_exec_seconds", "docker exec en el contenedor wireguard", ["op"])
+DB_SESSION_SECONDS = Histogram("autovpn_db_session_seconds", "Tiempo de vida de las sesiones de BD", ["mode"])
+BCRYPT_SECONDS = Histogram("autovpn_bcrypt_seconds", "Verificación bcrypt",
+                           buckets=(.05, .1, .2, .3, .5, .75, 1, 2, 5))
+QR_SECONDS = Histogram("autovpn_qr_render_seconds", "Render de QR", ["format"])
+
+PEERS_TOTAL = Gauge("autovpn_peers_total", "Peers no revocados")
+PEERS_ACTIVE = Gauge("autovpn_peers_active", "Peers con handshake reciente")
+HANDSHAKE_AGE = Gauge("autovpn_wg_handshake_age_peers", "Peers por antigüedad del último handshake (acumulado)", ["le"])
+HANDSHAKE_BUCKETS = (60, 180, 600, 3600, 86400, float("inf"))
+STARTUP_SECONDS = Gauge("autovpn_startup_seconds", "Arranque en frío por fase (import, init_db, ...)", ["phase"])
+
+# las gauges de wg0 se recalculan como mucho cada METRICS_WG_MAX_AGE segundos
+METRICS_WG_MAX_AGE = int(os.getenv("METRICS_WG_MAX_AGE", "15"))
+PEER_UP_SECONDS = int(os.getenv("WG_PEER_UP_SECONDS", "180"))
+_wg_lock = threading.Lock()
+_wg_at = 0.0
+
+class HttpMetrics:
+    """
+    Middleware ASGI puro (no BaseHTTPMiddleware): sin tarea extra por petición
+    y sin envolver el cuerpo, así el stream SSE pasa tal cual. La latencia se
+    mide hasta http.response.start, no hasta el final del stream.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        done = False
+
+        def observe(status: int):
+            nonlocal done
+            done = True
+            # plantilla de la ruta (p.ej. /peers/{peer_id}/qr), no la URL: cardinalidad acotada
+            path = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - t0)
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and not done:
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            if not done:
+                observe(500)
+
+def observe_cpu_task(name: str, seconds: float, args: tuple):
+    if name == "verify_pwd":
+        BCRYPT_SECONDS.observe(seconds)
+    elif name == "render_qr":
+        QR_SECONDS.labels(args[1] if len(args) > 1 else "png").observe(seconds)
+    elif name == "render_artifact":
+        QR_SECONDS.labels(args[3]).observe(seconds)
+
+def observe_startup(report: dict):
+    STARTUP_SECONDS.labels("import").set(report["import_s"])
+    for phase, seconds in report["phases"].items():
+        STARTUP_SECONDS.labels(phase).set(seconds)
+    STARTUP_SECONDS.labels("total").set(report["import_s"] + (report["total_s"] or 0))
+
+def _update_gauges():
+    global _wg_at
+    from sqlmodel import Session, select, func
+    from app.db import engine
+    from app.models import Peer
+    from app.wg import wg_dump
+    with Session(engine) as s:
+        PEERS_TOTAL.set(s.exec(select(func.count()).select_from(Peer).where(Peer.revoked_at == None)).one())  # noqa: E711
+    with _wg_lock:
+        if time.time() - _wg_at < METRICS_WG_MAX_AGE:
+            return
+        _wg_at = time.time()
+    try:
+        peers = wg_dump()
+    except Exception:
+        return
+    now = int(time.time())
+    ages = [now - p["latest_handshake"] for p in peers if p["latest_handshake"] > 0]
+    PEERS_ACTIVE.set(sum(1 for a in ages if a < PEER_UP_SECONDS))
+    for le in HANDSHAKE_BUCKETS:
+        HANDSHAKE_AGE.labels("+Inf" if le == float("inf") else str(le)).set(sum(1 for a in ages if a <= le))
+
+def render() -> tuple[bytes, str]:
+    _update_gauges()
+    return generate_latest(), CONTENT_TYPE_LATEST
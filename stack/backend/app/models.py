@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, Field, UniqueConstraint
+from sqlmodel import SQLModel, Field, UniqueConstraint, Index
 from typing import Optional
 from datetime import datetime
 
@@ -15,10 +15,10 @@ class Peer(SQLModel, table=True):
     user_id: int = Field(index=True)
     name: str
     client_private: str
-    client_public: str
-    client_ip: str
+    client_public: str = Field(index=True)
+    client_ip: str = Field(index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    revoked_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = Field(default=None, index=True)
 
 class Settings(SQLModel, table=True):
     __table_args__ = (UniqueConstraint("k"),)
@@ -26,3 +26,22 @@ class Settings(SQLModel, table=True):
     k: str
     v: str
 
+
+class FreeIp(SQLModel, table=True):
+    # offsets (dentro de WG_SUBNET) liberados por peers revocados
+    offset: int = Field(primary_key=True)
+
+class TrafficRollup(SQLModel, table=True):
+    # bytes acumulados por peer en buckets de `step` segundos (60/3600/86400)
+    __table_args__ = (Index("ix_traffic_step_bucket", "step", "bucket"),)
+    peer_id: int = Field(primary_key=True)
+    step: int = Field(primary_key=True)
+    bucket: int = Field(primary_key=True)
+    rx: int = 0
+    tx: int = 0
+
+class RateBucket(SQLModel, table=True):
+    # token bucket persistido (RATELIMIT_BACKEND=sqlite)
+    key: str = Field(primary_key=True)
+    tokens: float
+    ts: float
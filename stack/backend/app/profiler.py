@@ -0,0 +1,90 @@
+import os, sys, time, threading
+from collections import Counter
+
+# Profiler por muestreo, opt-in y acotado en el tiempo. Lee sys._current_frames()
+# cada `interval` desde un hilo propio: no instrumenta ni ralentiza las peticiones.
+# Salida en formato "collapsed stacks" (flamegraph.pl, speedscope, inferno).
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "120"))
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _label(frame) -> str:
+    code = frame.f_code
+    mod = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{mod}:{code.co_name}"
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.started_at: float | None = None
+        self.deadline: float | None = None
+        self.interval = 0.01
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: int, interval_ms: int = 10, app_only: bool = True) -> dict:
+        with self._lock:
+            if self.running:
+                raise RuntimeError("profiler already running")
+            seconds = max(1, min(seconds, PROFILER_MAX_SECONDS))
+            self.interval = max(1, interval_ms) / 1000.0
+            self.stacks = Counter(); self.samples = 0; self.dropped = 0
+            self.started_at = time.time(); self.deadline = self.started_at + seconds
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app_only,), name="profiler", daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        return self.status()
+
+    def _run(self, app_only: bool):
+        me = threading.get_ident()
+        while not self._stop.is_set() and time.time() < self.deadline:
+            with self._data:
+                self._sample(me, app_only)
+            self.samples += 1
+            self._stop.wait(self.interval)
+
+    def _sample(self, me: int, app_only: bool):
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            stack, in_app = [], False
+            while frame is not None:
+                stack.append(_label(frame))
+                in_app = in_app or frame.f_code.co_filename.startswith(APP_DIR)
+                frame = frame.f_back
+            # solo hilos que están ejecutando código de app/ (wg.py, auth.py, rutas...)
+            if app_only and not in_app:
+                continue
+            key = ";".join(reversed(stack))
+            if key not in self.stacks and len(self.stacks) >= PROFILER_MAX_STACKS:
+                self.dropped += 1
+                continue
+            self.stacks[key] += 1
+
+    def status(self) -> dict:
+        return {
+            "running": self.running, "samples": self.samples, "stacks": len(self.stacks),
+            "dropped": self.dropped, "interval_ms": int(self.interval * 1000),
+            "started_at": self.started_at, "deadline": self.deadline,
+        }
+
+    def collapsed(self) -> str:
+        with self._data:
+            top = self.stacks.most_common()
+        return "".join(f"{stack} {n}\n" for stack, n in top)
+
+profiler = SamplingProfiler()
@@ -0,0 +1,104 @@
+import os, time, threading
+from fastapi import HTTPException, Request
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from app.db import engine
+from app.models import RateBucket
+
+# Token bucket por IP y por cuenta delante de bcrypt/TOTP.
+# RATELIMIT_BACKEND=memory (por defecto) | sqlite (sobrevive a reinicios)
+RATELIMIT_BACKEND = os.getenv("RATELIMIT_BACKEND", "memory").lower()
+# scope -> (ráfaga, intentos por minuto)
+LIMITS = {
+    "ip": (int(os.getenv("RATELIMIT_IP_BURST", "20")), float(os.getenv("RATELIMIT_IP_PER_MIN", "10"))),
+    "acct": (int(os.getenv("RATELIMIT_ACCT_BURST", "5")), float(os.getenv("RATELIMIT_ACCT_PER_MIN", "3"))),
+}
+SWEEP_SECONDS = 60
+
+class RateLimiter:
+    def __init__(self, backend: str = RATELIMIT_BACKEND):
+        self.backend = backend
+        self._mem: dict[str, tuple[float, float]] = {}   # key -> (tokens, ts)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.rejected = {scope: 0 for scope in LIMITS}
+        self.allowed = 0
+
+    @staticmethod
+    def _ttl(scope: str) -> float:
+        # pasado este tiempo sin uso el bucket estaría lleno: se puede olvidar
+        burst, per_min = LIMITS[scope]
+        return burst / (per_min / 60.0)
+
+    def _refill(self, scope: str, state: tuple[float, float] | None, now: float) -> float:
+        burst, per_min = LIMITS[scope]
+        if state is None:
+            return float(burst)
+        tokens, ts = state
+        return min(float(burst), tokens + (now - ts) * per_min / 60.0)
+
+    def _take(self, keys: list[tuple[str, str]], load, store) -> float:
+        """ Devuelve 0 si se permite (y consume) o los segundos a esperar. """
+        now = time.time()
+        levels = [(scope, key, self._refill(scope, load(key), now)) for scope, key in keys]
+        wait = 0.0
+        for scope, _, tokens in levels:
+            if tokens < 1:
+                self.rejected[scope] += 1
+                wait = max(wait, (1 - tokens) * 60.0 / LIMITS[scope][1])
+        if wait:
+            return wait
+        for scope, key, tokens in levels:
+            store(key, tokens - 1, now)
+        self.allowed += 1
+        return 0.0
+
+    def _take_memory(self, keys):
+        with self._lock:
+            wait = self._take(keys, self._mem.get, lambda k, t, ts: self._mem.__setitem__(k, (t, ts)))
+            if time.monotonic() - self._last_sweep > SWEEP_SECONDS:
+                self._sweep()
+            return wait
+
+    def _sweep(self):
+        now = time.time()
+        ttl = max(self._ttl(scope) for scope in LIMITS)
+        for k in [k for k, (_, ts) in self._mem.items() if now - ts > ttl]:
+            del self._mem[k]
+        self._last_sweep = time.monotonic()
+
+    def _take_sqlite(self, keys):
+        with self._lock, Session(engine) as s:
+            def load(k):
+                b = s.get(RateBucket, k)
+                return (b.tokens, b.ts) if b else None
+            def store(k, tokens, ts):
+                s.merge(RateBucket(key=k, tokens=tokens, ts=ts))
+            wait = self._take(keys, load, store)
+            s.commit()
+            return wait
+
+    async def check(self, request: Request, account: str | None = None):
+        keys = [("ip", f"ip:{client_ip(request)}")]
+        if account:
+            keys.append(("acct", f"acct:{account.lower()}"))
+        if self.backend == "sqlite":
+            wait = await run_in_threadpool(self._take_sqlite, keys)
+        else:
+            wait = self._take_memory(keys)
+        if wait:
+            raise HTTPException(status_code=429, detail="too many attempts",
+                                headers={"Retry-After": str(int(wait) + 1)})
+
+    def metrics(self) -> dict:
+        return {"backend": self.backend, "allowed": self.allowed, "rejected": dict(self.rejected),
+                "tracked_keys": len(self._mem) if self.backend == "memory" else None}
+
+def client_ip(request: Request) -> str:
+    # detrás de Caddy: la última entrada de X-Forwarded-For es la que añade el proxy
+    xff = request.headers.get("x-forwarded-for")
+    if xff:
+        return xff.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+limiter = RateLimiter()
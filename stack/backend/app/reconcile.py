@@ -0,0 +1,91 @@
+import os, time, threading, logging
+from sqlmodel import Session, select
+from app.db import engine
+from app.models import Peer
+from app.wg import wg_dump, apply_peers
+
+RECONCILE_INTERVAL = int(os.getenv("WG_RECONCILE_INTERVAL", "60"))  # segundos; 0 = solo bajo demanda
+# wg0 es compartido (la API de despliegue añade peers sin fila Peer): por defecto solo
+# se quitan claves de peers revocados. WG_RECONCILE_PRUNE=1 quita también las desconocidas.
+RECONCILE_PRUNE = os.getenv("WG_RECONCILE_PRUNE", "0") == "1"
+
+log = logging.getLogger("autovpn.reconcile")
+
+class Reconciler:
+    """
+    Lleva wg0 al estado declarado en la tabla Peer: calcula el delta contra
+    `wg show wg0 dump` y lo aplica con `wg set` (por lotes). Las claves que no
+    están en la tabla se cuentan como `unknown` y solo se borran con prune.
+    """
+    def __init__(self, interval: int = RECONCILE_INTERVAL, prune: bool = RECONCILE_PRUNE):
+        self.interval = interval
+        self.prune = prune
+        self._run_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = {"runs": 0, "errors": 0, "added": 0, "removed": 0, "pruned": 0, "unknown": 0,
+                      "unchanged": 0, "prune": prune,
+                      "duration_ms": None, "last_run": None, "last_error": None}
+
+    def _desired(self) -> tuple[dict[str, str], set[str]]:
+        with Session(engine) as s:
+            rows = s.exec(select(Peer.client_public, Peer.client_ip).where(Peer.revoked_at == None)).all()  # noqa: E711
+            revoked = s.exec(select(Peer.client_public).where(Peer.revoked_at != None)).all()  # noqa: E711
+        desired = {pub: ip for pub, ip in rows}
+        return desired, {pub for pub in revoked if pub not in desired}
+
+    def run_once(self) -> dict:
+        with self._run_lock:
+            t0 = time.perf_counter()
+            try:
+                desired, revoked = self._desired()
+                live = {p["public_key"]: sorted(p["allowed_ips"]) for p in wg_dump()}
+                add = [(pub, ip) for pub, ip in desired.items() if live.get(pub) != [ip]]
+                remove = [pub for pub in live if pub in revoked]
+                unknown = [pub for pub in live if pub not in desired and pub not in revoked]
+                pruned = unknown if self.prune else []
+                apply_peers(add, remove + pruned)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+                log.warning("reconcile failed: %s", e)
+                raise
+            self.stats.update({
+                "runs": self.stats["runs"] + 1,
+                "added": len(add),
+                "removed": len(remove),
+                "pruned": len(pruned),
+                "unknown": len(unknown),
+                "unchanged": len(desired) - len(add),
+                "duration_ms": round((time.perf_counter() - t0) * 1000, 2),
+                "last_run": int(time.time()),
+                "last_error": None,
+            })
+            return dict(self.stats)
+
+    def trigger(self):
+        # despierta el bucle (p.ej. tras reiniciar el contenedor)
+        self._wake.set()
+
+    def _loop(self):
+        # interval 0: sin pasada al arrancar ni periódica; solo trigger() (reinicio del contenedor) y POST
+        if not self.interval:
+            self._wake.wait(); self._wake.clear()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                pass
+            self._wake.wait(self.interval or None)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="wg-reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set(); self._wake.set()
+
+reconciler = Reconciler()
@@ -0,0 +1,134 @@
+import os, time, threading, logging
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select, delete
+from app.db import engine
+from app.models import Peer, TrafficRollup
+from app.wg import wg_transfer
+
+SAMPLE_INTERVAL = int(os.getenv("TRAFFIC_SAMPLE_INTERVAL", "60"))  # segundos; 0 = desactivado
+
+# step (segundos) -> retención (segundos)
+STEPS = {"minute": 60, "hour": 3600, "day": 86400}
+RETENTION = {
+    60: int(os.getenv("TRAFFIC_KEEP_MINUTES_H", "48")) * 3600,
+    3600: int(os.getenv("TRAFFIC_KEEP_HOURS_D", "60")) * 86400,
+    86400: int(os.getenv("TRAFFIC_KEEP_DAYS", "730")) * 86400,
+}
+
+log = logging.getLogger("autovpn.traffic")
+
+ROLLUP_COLUMNS = 5   # peer_id, step, bucket, rx, tx: parámetros por fila del upsert
+_max_vars: int | None = None
+
+def max_sql_vars() -> int:
+    """
+    Parámetros por sentencia que acepta la BD. SQLite lo fija al compilar
+    (999 antes de 3.32, 32766 después); si el módulo no deja leerlo, 999.
+    """
+    global _max_vars
+    if _max_vars is None:
+        if engine.dialect.name != "sqlite":
+            _max_vars = 65535
+        else:
+            import sqlite3
+            with engine.connect() as c:
+                raw = c.connection.dbapi_connection
+                getlimit = getattr(raw, "getlimit", None)
+                _max_vars = getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER) if getlimit else 999
+    return _max_vars
+
+def _upsert(s: Session, rows: list[dict]):
+    # suma deltas sobre el bucket existente (ON CONFLICT DO UPDATE), por tandas que caben en una sentencia
+    n = max(1, max_sql_vars() // ROLLUP_COLUMNS)
+    for i in range(0, len(rows), n):
+        ins = (pg_insert if engine.dialect.name == "postgresql" else sqlite_insert)(TrafficRollup).values(rows[i:i + n])
+        s.exec(ins.on_conflict_do_update(
+            index_elements=["peer_id", "step", "bucket"],
+            set_={"rx": TrafficRollup.rx + ins.excluded.rx, "tx": TrafficRollup.tx + ins.excluded.tx},
+        ))
+
+def _peer_ids(s: Session, pubs: list[str]) -> dict[str, int]:
+    n = max_sql_vars()
+    ids: dict[str, int] = {}
+    for i in range(0, len(pubs), n):
+        ids.update(s.exec(select(Peer.client_public, Peer.id).where(Peer.client_public.in_(pubs[i:i + n]))).all())
+    return ids
+
+class TrafficSampler:
+    """
+    Muestrea `wg show wg0 transfer` cada SAMPLE_INTERVAL, calcula el delta por
+    peer y lo suma directamente en los rollups minuto/hora/día. No se guardan
+    muestras crudas: las consultas leen solo el rollup pedido.
+    """
+    def __init__(self, interval: int = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._last: dict[str, tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_evict = 0.0
+
+    def sample_once(self, now: int | None = None) -> int:
+        now = now or int(time.time())
+        cur = wg_transfer()
+        deltas = {}
+        for pub, (rx, tx) in cur.items():
+            prx, ptx = self._last.get(pub, (rx, tx))
+            # contadores reiniciados (wg0 recreada): el valor actual es el delta
+            drx = rx - prx if rx >= prx else rx
+            dtx = tx - ptx if tx >= ptx else tx
+            if drx or dtx:
+                deltas[pub] = (drx, dtx)
+        evict = now - self._last_evict >= 3600
+        if not deltas and not evict:
+            self._last = cur
+            return 0
+        rows = []
+        with Session(engine) as s:
+            if deltas:
+                ids = _peer_ids(s, list(deltas))
+                rows = [
+                    {"peer_id": ids[pub], "step": step, "bucket": now - now % step, "rx": drx, "tx": dtx}
+                    for pub, (drx, dtx) in deltas.items() if pub in ids
+                    for step in RETENTION
+                ]
+                _upsert(s, rows)
+            # también en los periodos sin tráfico
+            if evict:
+                self.evict(s, now)
+            s.commit()
+        # solo tras el commit: si la escritura falla, el siguiente ciclo vuelve a sumar estos deltas
+        self._last = cur
+        return len(rows) // len(RETENTION)
+
+    def evict(self, s: Session, now: int):
+        for step, keep in RETENTION.items():
+            s.exec(delete(TrafficRollup).where(TrafficRollup.step == step, TrafficRollup.bucket < now - keep))
+        self._last_evict = now
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                log.warning("traffic sample failed: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.interval and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="wg-traffic", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+def query_traffic(s: Session, peer_id: int, t_from: int, t_to: int, step: int) -> list[dict]:
+    rows = s.exec(
+        select(TrafficRollup.bucket, TrafficRollup.rx, TrafficRollup.tx)
+        .where(TrafficRollup.peer_id == peer_id, TrafficRollup.step == step,
+               TrafficRollup.bucket >= t_from - t_from % step, TrafficRollup.bucket <= t_to)
+        .order_by(TrafficRollup.bucket)
+    ).all()
+    return [{"t": b, "rx": rx, "tx": tx} for b, rx, tx in rows]
+
+sampler = TrafficSampler()
@@ -1,23 +1,57 @@
-import os, subprocess, base64
-import docker,json
+import os, subprocess, base64, threading, time
+import json
 from typing import Tuple
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives import serialization
+from app.docker_pool import DockerPool
+from app.metrics import DOCKER_EXEC_SECONDS
 
 WG_CONTAINER = os.getenv("WG_CONTAINER_NAME", "wireguard")
 WG_SUBNET = os.getenv("WG_SUBNET", "10.13.13.0/24")
 WG_DNS = os.getenv("WG_DNS", "10.13.13.1")
 WG_HOST = os.getenv("WG_HOST", "127.0.0.1")
 WG_PORT = int(os.getenv("WG_PORT", "51820"))
+# cláusulas peer por `wg set` (~110 B cada una): muy por debajo del ARG_MAX habitual (2 MB)
+WG_SET_BATCH = int(os.getenv("WG_SET_BATCH", "2000"))
+
+# cliente Docker compartido por todas las peticiones
+pool = DockerPool(WG_CONTAINER)
 
 def _run_in_wireguard(cmd: list[str]) -> Tuple[int,str,str]:
-    # usa Docker SDK para exec dentro del contenedor wireguard
-    client = docker.from_env()
-    c = client.containers.get(WG_CONTAINER)
-    exec_res = c.exec_run(cmd, stdout=True, stderr=True)
+    # usa Docker SDK (cliente persistente) para exec dentro del contenedor wireguard
+    t0 = time.perf_counter()
+    try:
+        exec_res = pool.exec_run(cmd)
+    finally:
+        op = " ".join(cmd[:3]) if cmd[0] == "wg" else cmd[0]
+        DOCKER_EXEC_SECONDS.labels(op).observe(time.perf_counter() - t0)
     code = exec_res.exit_code
     out = exec_res.output.decode() if isinstance(exec_res.output, (bytes,bytearray)) else str(exec_res.output)
     return code, out, ""
 
+def _clamp(raw: bytes) -> bytes:
+    # mismo "clamping" Curve25519 que aplica `wg genkey`
+    b = bytearray(raw)
+    b[0] &= 248
+    b[31] = (b[31] & 127) | 64
+    return bytes(b)
+
 def gen_keypair() -> Tuple[str,str]:
+    # Curve25519 en proceso: sin docker exec (equivalente a wg genkey | wg pubkey)
+    priv = base64.b64encode(_clamp(os.urandom(32))).decode()
+    return priv, public_key_from_private(priv)
+
+def gen_keypairs(n: int) -> list[Tuple[str,str]]:
+    # alta masiva: N pares (priv, pub) en una sola llamada
+    return [gen_keypair() for _ in range(n)]
+
+def public_key_from_private(priv: str) -> str:
+    pk = X25519PrivateKey.from_private_bytes(base64.b64decode(priv))
+    pub = pk.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+    return base64.b64encode(pub).decode()
+
+def gen_keypair_exec() -> Tuple[str,str]:
+    # ruta antigua vía contenedor (se mantiene para comparar en bench/)
     code, priv, _ = _run_in_wireguard(["bash","-lc","wg genkey"])
     if code != 0: raise RuntimeError("wg genkey failed")
     priv = priv.strip()
@@ -25,20 +59,85 @@ def gen_keypair() -> Tuple[str,str]:
     if code != 0: raise RuntimeError("wg pubkey failed")
     return priv, pub.strip()
 
-def server_public_key() -> str:
-    code, out, _ = _run_in_wireguard(["bash","-lc","wg show wg0 public-key"])
-    if code != 0: raise RuntimeError("wg show public-key failed")
-    return out.strip()
+# la clave de wg0 solo cambia al re-keyear la interfaz: se cachea en memoria
+_server_pub: str | None = None
+_server_pub_lock = threading.Lock()
+
+def server_public_key(refresh: bool = False) -> str:
+    global _server_pub
+    with _server_pub_lock:
+        if _server_pub and not refresh:
+            return _server_pub
+        code, out, _ = _run_in_wireguard(["bash","-lc","wg show wg0 public-key"])
+        if code != 0: raise RuntimeError("wg show public-key failed")
+        _server_pub = out.strip()
+        return _server_pub
 
-def allocate_ip(next_host:int) -> str:
-    # súper simple: asume /24 y que .1 es el servidor
-    base = ".".join(WG_SUBNET.split("/")[0].split(".")[:3])
-    return f"{base}.{next_host}/32"
+def invalidate_server_public_key():
+    global _server_pub
+    with _server_pub_lock:
+        _server_pub = None
 
 def add_peer(server_pub: str, client_pub: str, client_ip_cidr: str):
     code, out, err = _run_in_wireguard(["bash","-lc",f"wg set wg0 peer {client_pub} allowed-ips {client_ip_cidr}"])
     if code != 0: raise RuntimeError(f"wg set failed: {out or err}")
 
+def add_peers(peers: list[Tuple[str,str]]):
+    # alta masiva: un único `wg set` con todas las cláusulas peer (sin shell)
+    apply_peers(peers, [])
+
+def apply_peers(add: list[Tuple[str,str]], remove: list[str]):
+    # altas y bajas con `wg set`, WG_SET_BATCH cláusulas por invocación: lo habitual cabe
+    # en una, y decenas de miles (p.ej. tras reiniciar el contenedor) no dan E2BIG
+    clauses = [["peer", client_pub, "allowed-ips", client_ip_cidr] for client_pub, client_ip_cidr in add]
+    clauses += [["peer", client_pub, "remove"] for client_pub in remove]
+    for i in range(0, len(clauses), WG_SET_BATCH):
+        cmd = ["wg","set","wg0"]
+        for clause in clauses[i:i + WG_SET_BATCH]:
+            cmd += clause
+        code, out, err = _run_in_wireguard(cmd)
+        if code != 0: raise RuntimeError(f"wg set failed: {out or err}")
+
+def parse_dump(raw: str) -> list[dict]:
+    """
+    Parsea `wg show wg0 dump` (o `wg show all dump`, con la interfaz en la 1ª columna).
+    Ignora la línea de la interfaz; devuelve un dict por peer.
+    """
+    peers = []
+    for line in raw.splitlines():
+        f = line.split("\t")
+        if len(f) == 9:
+            f = f[1:]
+        if len(f) != 8:
+            continue
+        pub, _psk, endpoint, allowed, hs, rx, tx, ka = f
+        peers.append({
+            "public_key": pub,
+            "endpoint": None if endpoint == "(none)" else endpoint,
+            "allowed_ips": [] if allowed == "(none)" else allowed.split(","),
+            "latest_handshake": int(hs),
+            "rx_bytes": int(rx),
+            "tx_bytes": int(tx),
+            "keepalive": None if ka == "off" else int(ka),
+        })
+    return peers
+
+def wg_transfer() -> dict[str, Tuple[int,int]]:
+    # `wg show wg0 transfer`: <pub>\t<rx>\t<tx> por peer
+    code, out, err = _run_in_wireguard(["wg","show","wg0","transfer"])
+    if code != 0: raise RuntimeError(f"wg show transfer failed: {out or err}")
+    res = {}
+    for line in out.splitlines():
+        f = line.split("\t")
+        if len(f) == 3:
+            res[f[0]] = (int(f[1]), int(f[2]))
+    return res
+
+def wg_dump() -> list[dict]:
+    code, out, err = _run_in_wireguard(["wg","show","wg0","dump"])
+    if code != 0: raise RuntimeError(f"wg show dump failed: {out or err}")
+    return parse_dump(out)
+
 def remove_peer(client_pub: str):
     _run_in_wireguard(["bash","-lc",f"wg set wg0 peer {client_pub} remove"])
 
@@ -55,26 +154,30 @@ Endpoint = {WG_HOST}:{WG_PORT}
 PersistentKeepalive = 25
 """
 def docker_client():
-    return docker.from_env()
+    return pool.client()
 
 def container_control(action: str) -> dict:
-    cli = docker_client()
-    c = cli.containers.get(WG_CONTAINER)
-    if action == "start":
-        c.start()
-    elif action == "stop":
-        c.stop(timeout=10)
-    elif action == "restart":
-        c.restart(timeout=10)
-    else:
+    if action not in {"start","stop","restart"}:
         raise ValueError("invalid action")
-    c.reload()
+    def _do(c):
+        if action == "start":
+            c.start()
+        elif action == "stop":
+            c.stop(timeout=10)
+        else:
+            c.restart(timeout=10)
+        c.reload()
+        return c
+    c = pool.call(action, _do)
+    if action in {"start","restart"}:
+        # el contenedor puede arrancar con otra clave (p.ej. /config regenerado)
+        invalidate_server_public_key()
     return {"name": c.name, "status": c.status}
 
+def docker_metrics() -> dict:
+    return pool.metrics()
+
 def wg_show() -> dict:
-    cli = docker_client()
-    c = cli.containers.get(WG_CONTAINER)
-    exec_res = c.exec_run(["bash","-lc","wg show all dump || wg show"], stdout=True, stderr=True)
-    out = exec_res.output.decode(errors="ignore")
+    _, out, _ = _run_in_wireguard(["bash","-lc","wg show all dump || wg show"])
     # Si está vacío o error, devolver status del contenedor
     return {"raw": out.strip()}
@@ -0,0 +1,72 @@
+import os, time, asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+from app.metrics import observe_cpu_task
+
+# Pool dedicado para trabajo CPU (bcrypt, QR): no compite con el threadpool de FastAPI
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+CPU_POOL_MODE = os.getenv("CPU_POOL_MODE", "thread").lower()     # thread | process
+CPU_POOL_MAX_QUEUE = int(os.getenv("CPU_POOL_MAX_QUEUE", "64"))  # 0 = sin límite
+CPU_POOL_RETRY_AFTER = int(os.getenv("CPU_POOL_RETRY_AFTER", "2"))
+
+def _timed_call(fn, *args):
+    # time.time() (reloj de pared) para poder comparar entre procesos
+    started = time.time()
+    res = fn(*args)
+    return started, time.time() - started, res
+
+class CpuPool:
+    """
+    Ejecutor acotado para operaciones CPU. Si hay CPU_POOL_MAX_QUEUE tareas
+    pendientes responde 503 + Retry-After en lugar de encolar más.
+    Solo se usa desde el event loop, así que los contadores no necesitan lock.
+    """
+    def __init__(self, size: int = CPU_POOL_SIZE, mode: str = CPU_POOL_MODE, max_queue: int = CPU_POOL_MAX_QUEUE):
+        self.size = size
+        self.mode = mode
+        self.max_queue = max_queue
+        self._ex = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._waits: deque = deque(maxlen=1024)
+
+    def _executor(self):
+        if self._ex is None:
+            cls = ProcessPoolExecutor if self.mode == "process" else ThreadPoolExecutor
+            self._ex = cls(max_workers=self.size)
+        return self._ex
+
+    async def run(self, fn, *args):
+        if self.max_queue and self.pending >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="server busy",
+                                headers={"Retry-After": str(CPU_POOL_RETRY_AFTER)})
+        self.pending += 1
+        submitted = time.time()
+        try:
+            started, took, res = await asyncio.get_running_loop().run_in_executor(self._executor(), _timed_call, fn, *args)
+            self._waits.append(max(0.0, started - submitted))
+            observe_cpu_task(fn.__name__, took, args)
+            self.completed += 1
+            return res
+        finally:
+            self.pending -= 1
+
+    def metrics(self) -> dict:
+        w = sorted(self._waits); n = len(w)
+        pick = lambda q: round(w[min(n - 1, int(q * n))] * 1000, 3) if n else None
+        return {
+            "mode": self.mode, "size": self.size, "max_queue": self.max_queue,
+            "queue_depth": max(0, self.pending - self.size), "in_flight": self.pending,
+            "completed": self.completed, "rejected": self.rejected,
+            "wait_p50_ms": pick(0.50), "wait_p95_ms": pick(0.95), "wait_max_ms": round(w[-1] * 1000, 3) if n else None,
+        }
+
+    def shutdown(self):
+        if self._ex is not None:
+            self._ex.shutdown(wait=False, cancel_futures=True)
+            self._ex = None
+
+cpu = CpuPool()
@@ -0,0 +1,54 @@
+# bench/bench_db.py
+# GET /api/peers concurrente con DB_ASYNC=0 y DB_ASYNC=1 (sin Docker: solo toca la BD).
+# Uso (desde stack/backend):  python bench/bench_db.py [peers] [concurrencia] [peticiones]
+import os, sys, json, time, asyncio, tempfile, subprocess
+
+def _child(peers: int, conc: int, total: int):
+    import httpx
+    from sqlmodel import Session
+    from app.db import init_db, engine
+    from app.models import Peer
+    from app.auth import make_token
+    from app.main import app
+
+    init_db()
+    with Session(engine) as s:
+        s.add_all([Peer(user_id=0, name=f"p{i}", client_private="x", client_public=f"k{i}",
+                        client_ip=f"10.13.{i // 250}.{i % 250 + 2}/32") for i in range(peers)])
+        s.commit()
+    token = make_token("bench@local", 60, "access")
+
+    async def run():
+        lat = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={"access": token}) as c:
+            sem = asyncio.Semaphore(conc)
+            async def one():
+                async with sem:
+                    t0 = time.perf_counter()
+                    r = await c.get("/api/peers")
+                    r.raise_for_status()
+                    lat.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(total)))
+            return time.perf_counter() - t0, sorted(lat)
+
+    wall, lat = asyncio.run(run())
+    pick = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2)
+    print(json.dumps({"rps": round(total / wall, 1), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}))
+
+def main():
+    args = [int(a) for a in sys.argv[1:4]]
+    peers, conc, total = args + [1000, 32, 200][len(args):]
+    if os.getenv("BENCH_CHILD"):
+        return _child(peers, conc, total)
+    for mode in ("0", "1"):
+        with tempfile.TemporaryDirectory() as d:
+            env = {**os.environ, "BENCH_CHILD": "1", "DB_ASYNC": mode,
+                   "DB_URL": f"sqlite:///{d}/bench.db", "PYTHONPATH": os.getcwd()}
+            out = subprocess.run([sys.executable, __file__, str(peers), str(conc), str(total)],
+                                 env=env, capture_output=True, text=True, check=True).stdout
+            print(f"DB_ASYNC={mode} peers={peers} conc={conc} n={total} -> {out.strip().splitlines()[-1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# bench/bench_keygen.py
+# Compara la generación de claves en proceso frente a la ruta docker exec.
+# Uso (desde stack/backend):  PYTHONPATH=. python bench/bench_keygen.py [N] [--exec]
+import sys, time
+from app.wg import gen_keypair, gen_keypairs, gen_keypair_exec
+
+def _bench(label: str, fn, n: int):
+    t0 = time.perf_counter()
+    fn(n)
+    dt = time.perf_counter() - t0
+    print(f"{label:<14} n={n:<6} total={dt*1000:9.1f} ms  por_par={dt/n*1e6:9.1f} us")
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    n = int(args[0]) if args else 1000
+    _bench("in-process", lambda k: [gen_keypair() for _ in range(k)], n)
+    _bench("batch", gen_keypairs, n)
+    if "--exec" in sys.argv:
+        # requiere el contenedor wireguard en marcha; pocas iteraciones
+        m = min(n, 20)
+        _bench("docker exec", lambda k: [gen_keypair_exec() for _ in range(k)], m)
+
+if __name__ == "__main__":
+    main()
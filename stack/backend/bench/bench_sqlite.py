@@ -0,0 +1,66 @@
+# bench/bench_sqlite.py
+# Carga mixta sobre SQLite (altas de peers + logins/lecturas) con y sin el perfil
+# WAL/pragmas de app/db.py (SQLITE_TUNING=0/1).
+# Uso (desde stack/backend):  python bench/bench_sqlite.py [hilos] [ops_por_hilo]
+import os, sys, json, time, tempfile, threading, subprocess
+
+def _child(threads: int, ops: int):
+    from sqlmodel import Session, select
+    from app.db import init_db, engine
+    from app.models import Peer, User
+
+    init_db()
+    with Session(engine) as s:
+        s.add(User(email="admin@local", password_hash="x")); s.commit()
+
+    lat = {"write": [], "read": []}
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(n: int):
+        for i in range(ops):
+            kind = "write" if i % 2 == 0 else "read"
+            t0 = time.perf_counter()
+            try:
+                with Session(engine) as s:
+                    if kind == "write":
+                        s.add(Peer(user_id=0, name=f"w{n}-{i}", client_private="x",
+                                   client_public=f"k{n}-{i}", client_ip=f"10.{n}.{i // 250}.{i % 250}/32"))
+                        s.commit()
+                    else:
+                        s.exec(select(User).where(User.email == "admin@local")).first()
+                        s.exec(select(Peer.id).where(Peer.client_public == f"k{n}-{i - 1}")).first()
+            except Exception:
+                with lock: errors[0] += 1
+                continue
+            with lock: lat[kind].append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    ths = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in ths: t.start()
+    for t in ths: t.join()
+    wall = time.perf_counter() - t0
+
+    res = {"ops_s": round(threads * ops / wall, 1), "errors": errors[0]}
+    for kind, v in lat.items():
+        v.sort()
+        if v:
+            res[f"{kind}_p50_ms"] = round(v[len(v) // 2] * 1000, 2)
+            res[f"{kind}_p99_ms"] = round(v[min(len(v) - 1, int(len(v) * 0.99))] * 1000, 2)
+    print(json.dumps(res))
+
+def main():
+    args = [int(a) for a in sys.argv[1:3]]
+    threads, ops = args + [8, 200][len(args):]
+    if os.getenv("BENCH_CHILD"):
+        return _child(threads, ops)
+    for tuning in ("0", "1"):
+        with tempfile.TemporaryDirectory() as d:
+            env = {**os.environ, "BENCH_CHILD": "1", "SQLITE_TUNING": tuning,
+                   "DB_URL": f"sqlite:///{d}/bench.db", "PYTHONPATH": os.getcwd()}
+            out = subprocess.run([sys.executable, __file__, str(threads), str(ops)],
+                                 env=env, capture_output=True, text=True, check=True).stdout
+            print(f"SQLITE_TUNING={tuning} threads={threads} ops={ops} -> {out.strip().splitlines()[-1]}")
+
+if __name__ == "__main__":
+    main()
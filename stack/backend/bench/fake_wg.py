@@ -0,0 +1,120 @@
+# bench/fake_wg.py
+# Sustituto en memoria del contenedor `wireguard` para benchmarks y pruebas locales.
+# Simula `wg genkey/pubkey/set/show` con latencia configurable. Se inyecta a nivel
+# de cliente Docker (pool._client), así que el DockerPool real (handle cacheado,
+# reintento por NotFound, locks, métricas) y _run_in_wireguard se ejercitan igual.
+import time, random, threading
+from types import SimpleNamespace
+from app.wg import gen_keypair, public_key_from_private
+
+class FakeContainer:
+    def __init__(self, wg: "FakeWireguard"):
+        self.wg = wg
+        self.name = "wireguard-fake"
+        self.status = "running"
+    def exec_run(self, cmd: list[str], stdout=True, stderr=True):
+        return self.wg.exec_run(cmd)
+    def start(self): self.status = "running"
+    def stop(self, timeout=10): self.status = "exited"
+    def restart(self, timeout=10): self.status = "running"
+    def reload(self): pass
+
+class FakeClient:
+    """ Lo que DockerPool usa de docker.DockerClient: containers.get(name). """
+    def __init__(self, container: FakeContainer):
+        self.container = container
+        self.gets = 0
+        self.containers = SimpleNamespace(get=self._get)
+    def _get(self, name: str):
+        self.gets += 1
+        return self.container
+
+class FakeWireguard:
+    """
+    Estado de wg0 en memoria. `latency_ms` (+/- `jitter_ms`) se aplica a cada exec
+    para imitar el coste del round-trip por docker.sock.
+    """
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 5):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.server_priv, self.server_pub = gen_keypair()
+        self.peers: dict[str, dict] = {}
+        self.container = FakeContainer(self)
+        self.client = FakeClient(self.container)
+        self.execs = 0
+        self._lock = threading.Lock()
+
+    def exec_run(self, cmd: list[str]):
+        with self._lock:
+            self.execs += 1
+        if self.latency:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        code, out = self._dispatch(cmd)
+        return SimpleNamespace(exit_code=code, output=out.encode())
+
+    # --- simulación de `wg` ---
+    def _dispatch(self, cmd: list[str]) -> tuple[int, str]:
+        if cmd[:2] == ["bash", "-lc"]:
+            line = cmd[2]
+            if line == "wg genkey":
+                return 0, gen_keypair()[0] + "\n"
+            if line.endswith("| wg pubkey"):
+                priv = line.split("'")[3]
+                return 0, public_key_from_private(priv) + "\n"
+            if line.startswith("wg show all dump"):
+                return 0, self._dump(prefix="wg0\t")
+            cmd = line.split()
+        if cmd[:2] != ["wg", "set"] and cmd[:2] != ["wg", "show"]:
+            return 1, f"unsupported: {cmd}"
+        if cmd[1] == "show":
+            what = cmd[3] if len(cmd) > 3 else "dump"
+            if what == "public-key":
+                return 0, self.server_pub + "\n"
+            if what == "dump":
+                return 0, self._dump()
+            if what == "transfer":
+                with self._lock:
+                    return 0, "".join(f"{k}\t{p['rx']}\t{p['tx']}\n" for k, p in self.peers.items())
+            return 1, f"unsupported: {cmd}"
+        return self._set(cmd[3:])
+
+    def _set(self, args: list[str]) -> tuple[int, str]:
+        with self._lock:
+            i = 0
+            while i < len(args):
+                if args[i] != "peer":
+                    return 1, f"bad arg {args[i]}"
+                pub = args[i + 1]
+                if i + 2 < len(args) and args[i + 2] == "remove":
+                    self.peers.pop(pub, None); i += 3
+                elif i + 3 < len(args) and args[i + 2] == "allowed-ips":
+                    self.peers[pub] = {"ips": args[i + 3], "hs": 0, "rx": 0, "tx": 0}; i += 4
+                else:
+                    return 1, "bad peer clause"
+        return 0, ""
+
+    def _dump(self, prefix: str = "") -> str:
+        with self._lock:
+            lines = [f"{prefix}{self.server_priv}\t{self.server_pub}\t51820\toff"]
+            for k, p in self.peers.items():
+                lines.append(f"{prefix}{k}\t(none)\t(none)\t{p['ips']}\t{p['hs']}\t{p['rx']}\t{p['tx']}\t25")
+        return "\n".join(lines) + "\n"
+
+    def simulate_traffic(self, active_ratio: float = 0.3):
+        # handshakes y contadores para que status/transfer devuelvan datos realistas
+        now = int(time.time())
+        with self._lock:
+            for p in self.peers.values():
+                if random.random() < active_ratio:
+                    p["hs"] = now - random.randint(0, 170)
+                    p["rx"] += random.randint(0, 1 << 20)
+                    p["tx"] += random.randint(0, 1 << 20)
+
+def install(fake: FakeWireguard):
+    # el pool real se queda; solo cambia el cliente y se descarta el handle cacheado
+    import app.wg as wg
+    with wg.pool._lock:
+        wg.pool._client = fake.client
+        wg.pool._container = None
+    wg.invalidate_server_public_key()
+    return fake
@@ -0,0 +1,146 @@
+# bench/loadtest.py
+# Suite de carga reproducible del backend contra el WireGuard simulado (bench/fake_wg.py).
+# Escenarios: login, alta de peers, listado, descarga conf/QR y sondeo de estado,
+# con 1k / 10k / 50k peers. Imprime rps y p50/p95/p99 por escenario.
+#
+# Uso (desde stack/backend):
+#   python bench/loadtest.py                       # 1000,10000,50000 peers
+#   python bench/loadtest.py --peers 1000 --concurrency 16 --exec-latency-ms 20 --json out.json
+import os, sys, json, time, random, asyncio, argparse, tempfile, subprocess
+
+SCENARIOS = ("login", "create_peer", "list_peers", "download_conf", "download_qr", "status")
+
+def _pct(lat: list[float], q: float) -> float:
+    return round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 2) if lat else None
+
+def _seed(n: int, fake):
+    from sqlalchemy import insert
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Peer
+    from app.wg import gen_keypairs
+    from app.ipam import init_ipam, allocate_ips
+    with Session(engine) as s:
+        init_ipam(s)
+        keys = gen_keypairs(n)
+        ips = allocate_ips(s, n)
+        rows = [{"user_id": 0, "name": f"peer{i}", "client_private": priv, "client_public": pub, "client_ip": ip}
+                for i, ((priv, pub), ip) in enumerate(zip(keys, ips))]
+        for i in range(0, n, 5000):
+            s.exec(insert(Peer).values(rows[i:i + 5000]))
+        s.commit()
+    for r in rows:
+        fake.peers[r["client_public"]] = {"ips": r["client_ip"], "hs": 0, "rx": 0, "tx": 0}
+    fake.simulate_traffic()
+
+def _child(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import httpx
+    from passlib.hash import bcrypt
+    from sqlmodel import Session
+    from fake_wg import FakeWireguard, install
+    from app.db import init_db, engine
+    from app.models import User
+    from app.auth import make_token
+    from app.main import app
+    from app.wg import docker_metrics
+
+    fake = install(FakeWireguard(args.exec_latency_ms, args.exec_latency_ms / 4))
+    init_db()
+    with Session(engine) as s:
+        s.add(User(email="bench@local", password_hash=bcrypt.hash("bench"))); s.commit()
+    t0 = time.perf_counter()
+    _seed(args.peers, fake)
+    seed_s = time.perf_counter() - t0
+    token = make_token("bench@local", 120, "access")
+    max_id = args.peers
+
+    def request(name: str):
+        pid = random.randint(1, max_id)
+        if name == "login":
+            return "POST", "/auth/login", {"json": {"email": "bench@local", "password": "bench"}}
+        if name == "create_peer":
+            return "POST", "/peers", {"json": f"bench-{random.random()}"}
+        if name == "list_peers":
+            return "GET", f"/api/peers?limit=100&cursor={random.randint(0, max(0, max_id - 100))}", {}
+        if name == "download_conf":
+            return "GET", f"/peers/{pid}/config", {}
+        if name == "download_qr":
+            return "GET", f"/peers/{pid}/qr", {}
+        return "GET", "/api/wireguard/status?limit=100&active_minutes=5", {}
+
+    async def scenario(c, name: str, n: int):
+        lat, errors = [], 0
+        sem = asyncio.Semaphore(args.concurrency)
+        async def one():
+            nonlocal errors
+            method, url, kw = request(name)
+            async with sem:
+                t = time.perf_counter()
+                r = await c.request(method, url, **kw)
+                lat.append(time.perf_counter() - t)
+                if r.status_code >= 400:
+                    errors += 1
+        t = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        wall = time.perf_counter() - t
+        lat.sort()
+        return {"scenario": name, "peers": args.peers, "n": n, "errors": errors,
+                "rps": round(n / wall, 1), "p50_ms": _pct(lat, .5), "p95_ms": _pct(lat, .95), "p99_ms": _pct(lat, .99)}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="https://bench", cookies={"access": token}) as c:
+            out = []
+            for name in args.scenarios:
+                n = args.login_requests if name == "login" else args.requests
+                out.append(await scenario(c, name, n))
+            return out
+
+    results = asyncio.run(run())
+    # latencias vistas por el DockerPool real (exec / inspect) sobre el cliente simulado
+    print(json.dumps({"seed_s": round(seed_s, 2), "execs": fake.execs, "docker": docker_metrics(), "results": results}))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--peers", default="1000,10000,50000")
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--login-requests", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--exec-latency-ms", type=float, default=20)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--json", help="fichero donde guardar los resultados")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    if args.child:
+        args.peers = int(args.peers)
+        return _child(args)
+
+    random.seed(0)
+    all_results = []
+    print(f"{'scenario':<14}{'peers':>7}{'n':>6}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for peers in (int(p) for p in args.peers.split(",")):
+        with tempfile.TemporaryDirectory() as d:
+            env = {**os.environ, "DB_URL": f"sqlite:///{d}/load.db", "PYTHONPATH": os.getcwd(),
+                   "RATELIMIT_IP_BURST": "1000000", "RATELIMIT_ACCT_BURST": "1000000",
+                   "CPU_POOL_MAX_QUEUE": "0", "WG_SUBNET": "10.13.0.0/16",
+                   "JWT_SECRET": "bench-secret-bench-secret-bench-secret"}
+            cmd = [sys.executable, __file__, "--child", "--peers", str(peers),
+                   "--requests", str(args.requests), "--login-requests", str(args.login_requests),
+                   "--concurrency", str(args.concurrency), "--exec-latency-ms", str(args.exec_latency_ms),
+                   "--scenarios", ",".join(args.scenarios)]
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            if proc.returncode:
+                sys.exit(proc.stderr)
+            res = json.loads(proc.stdout.strip().splitlines()[-1])
+            for r in res["results"]:
+                print(f"{r['scenario']:<14}{r['peers']:>7}{r['n']:>6}{r['errors']:>5}{r['rps']:>9}"
+                      f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}")
+            all_results.append({"peers": peers, **res})
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench/startup.py
+# Informe de arranque en frío para seguir la latencia entre releases:
+#  - tiempo de `import app.main` y los módulos más caros (python -X importtime)
+#  - hooks de startup con BD nueva (crea esquema) y con BD existente (huella en caché)
+#
+# Uso (desde stack/backend):
+#   python bench/startup.py [--runs 5] [--top 15] [--json out.json]
+import os, sys, json, argparse, tempfile, subprocess, statistics
+
+CHILD = r"""
+import time, json
+t0 = time.perf_counter()
+import app.main as m
+t_import = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+t1 = time.perf_counter()
+with TestClient(m.app) as c:
+    t_start = time.perf_counter() - t1
+    ok = c.get("/health").status_code == 200
+print(json.dumps({"import_s": t_import, "startup_s": t_start, "ready_s": t_import + t_start,
+                  "phases": m.STARTUP["phases"], "schema_applied": m.STARTUP["schema_applied"], "ok": ok}))
+"""
+
+def _env(db: str) -> dict:
+    # sin reconciliador/sampler contra docker real: solo se mide el arranque
+    return {**os.environ, "PYTHONPATH": os.getcwd(), "DB_URL": f"sqlite:///{db}",
+            "WG_RECONCILE_INTERVAL": "0", "TRAFFIC_SAMPLE_INTERVAL": "0"}
+
+def _run(db: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD], env=_env(db), capture_output=True, text=True)
+    if out.returncode:
+        sys.exit(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def import_profile(top: int) -> list[tuple[str, float]]:
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                         env={**os.environ, "PYTHONPATH": os.getcwd()}, capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # app.main y lo que importa directamente (la sangría marca la profundidad)
+        if len(name) - len(name.lstrip()) > 3:
+            continue
+        rows.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(rows, key=lambda r: -r[1])[:top]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--json")
+    args = ap.parse_args()
+
+    report = {"python": sys.version.split()[0], "cold": [], "warm": []}
+    with tempfile.TemporaryDirectory() as d:
+        for i in range(args.runs):
+            report["cold"].append(_run(f"{d}/cold{i}.db"))    # BD nueva: create_all + migraciones
+            report["warm"].append(_run(f"{d}/cold{i}.db"))    # misma BD: solo el SELECT de la huella
+    report["imports"] = import_profile(args.top)
+
+    for mode in ("cold", "warm"):
+        runs = report[mode]
+        print(f"{mode:<5} import {statistics.median(r['import_s'] for r in runs):.3f}s  "
+              f"startup {statistics.median(r['startup_s'] for r in runs):.3f}s  "
+              f"ready {statistics.median(r['ready_s'] for r in runs):.3f}s  "
+              f"init_db {statistics.median(r['phases'].get('init_db', 0) for r in runs):.4f}s")
+    print("\nimports más caros (acumulado):")
+    for name, s in report["imports"]:
+        print(f"  {s:7.3f}s  {name}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
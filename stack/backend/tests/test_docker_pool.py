@@ -0,0 +1,107 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from docker.errors import NotFound
+
+from app.docker_pool import DockerPool
+
+
+class StubContainer:
+    def __init__(self, cid):
+        self.id = cid
+        self.execs = []
+
+    def exec_run(self, cmd, stdout=True, stderr=True):
+        self.execs.append(cmd)
+        return SimpleNamespace(exit_code=0, output=b"ok")
+
+
+class StubClient:
+    def __init__(self):
+        self.gets = 0
+        self.current = StubContainer("c1")
+        self.containers = SimpleNamespace(get=self._get)
+
+    def _get(self, name):
+        self.gets += 1
+        return self.current
+
+
+def _pool(client):
+    pool = DockerPool("wireguard")
+    pool._client = client
+    return pool
+
+
+def _in_thread(fn, timeout=5):
+    # un deadlock no debe colgar la suite
+    out = {}
+    def run():
+        try:
+            out["res"] = fn()
+        except Exception as e:
+            out["exc"] = e
+    t = threading.Thread(target=run, daemon=True)
+    t.start(); t.join(timeout)
+    assert not t.is_alive(), "DockerPool bloqueado"
+    if "exc" in out:
+        raise out["exc"]
+    return out["res"]
+
+
+def test_container_is_inspected_once_and_cached():
+    cli = StubClient()
+    pool = _pool(cli)
+    c = _in_thread(pool.container)
+    assert c is cli.current
+    assert _in_thread(pool.container) is c
+    assert cli.gets == 1
+    assert pool.metrics()["inspect"]["count"] == 1
+
+
+def test_exec_run_uses_cached_container_and_records_latency():
+    cli = StubClient()
+    pool = _pool(cli)
+    for _ in range(3):
+        res = _in_thread(lambda: pool.exec_run(["wg", "show"]))
+        assert res.exit_code == 0
+    assert cli.current.execs == [["wg", "show"]] * 3
+    assert cli.gets == 1
+    m = pool.metrics()["exec"]
+    assert m["count"] == 3 and m["errors"] == 0
+
+
+def test_exec_run_retries_once_when_container_was_recreated():
+    cli = StubClient()
+    pool = _pool(cli)
+    _in_thread(pool.container)
+
+    old = cli.current
+    old.exec_run = lambda *a, **k: (_ for _ in ()).throw(NotFound("gone"))
+    cli.current = StubContainer("c2")
+    res = _in_thread(lambda: pool.exec_run(["wg", "show"]))
+    assert res.exit_code == 0
+    assert cli.current.execs == [["wg", "show"]]
+    assert cli.gets == 2
+    assert pool.metrics()["exec"]["errors"] == 1
+
+
+def test_concurrent_first_calls_do_not_deadlock():
+    cli = StubClient()
+    pool = _pool(cli)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.exec_run(["wg"])), daemon=True) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join(5)
+    assert len(results) == 8
+    assert cli.gets == 1
+
+
+def test_errors_propagate():
+    cli = StubClient()
+    cli.containers = SimpleNamespace(get=lambda name: (_ for _ in ()).throw(RuntimeError("docker down")))
+    pool = _pool(cli)
+    with pytest.raises(RuntimeError):
+        _in_thread(pool.container)
+    assert pool.metrics()["inspect"]["errors"] == 1